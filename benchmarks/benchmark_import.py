@@ -0,0 +1,154 @@
+"""
+Measures how long it takes to import the report library and to start a worker process,
+and checks them against a budget.
+
+Each import is timed in a fresh interpreter with `python -X importtime`, so the numbers
+are cold-start numbers. The heavy dependencies (pandas, numpy, openpyxl, Pillow and
+Streamlit) are imported lazily and must not show up at all.
+
+Usage:
+    python benchmarks/benchmark_import.py
+    python benchmarks/benchmark_import.py --budget-ms 250 --repeat 10 --output import.json
+
+Exits with status 1 if the median import time is over budget or a forbidden module was
+imported, so it can run as a check.
+"""
+import argparse
+import concurrent.futures
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmark_pipeline import REPO_DIR, git_commit
+
+DEFAULT_MODULE = "sef_reports"
+DEFAULT_BUDGET_MS = 250
+FORBIDDEN_MODULES = ["pandas", "numpy", "openpyxl", "PIL.Image", "streamlit"]
+
+
+def import_times(module):
+    """
+    Imports a module in a fresh interpreter with -X importtime.
+
+    Args:
+        module (str): The module to import.
+
+    Returns:
+        dict: The cumulative import time, in microseconds, of the module and of every
+        module it imported, by name. Modules the interpreter imported at startup are left out.
+    """
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                               cwd=REPO_DIR, capture_output=True, text=True, check=True)
+    lines = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        lines.append((name.strip(), int(cumulative), len(name) - len(name.lstrip())))
+    # Each module is listed after the modules it imported, which are indented further
+    end = max(i for i, (name, _, _) in enumerate(lines) if name == module)
+    depth = lines[end][2]
+    start = end
+    while start > 0 and lines[start - 1][2] > depth:
+        start -= 1
+    return {name: cumulative for name, cumulative, _ in lines[start:end + 1]}
+
+
+def interpreter_start_seconds():
+    """
+    Returns:
+        float: How long an empty interpreter takes to start and exit.
+    """
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], check=True)
+    return time.perf_counter() - start
+
+
+def worker_start_seconds(module):
+    """
+    Starts a worker process the way the app does on macOS and Windows (spawn), and waits
+    for it to import the module and run one task.
+
+    Returns:
+        float: The seconds until the first task's result came back.
+    """
+    sys.path.insert(0, REPO_DIR)
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"),
+                                                initializer=__import__, initargs=(module,)) as executor:
+        executor.submit(os.getpid).result()
+        return time.perf_counter() - start
+
+
+def measure(module, repeat):
+    """
+    Args:
+        module (str): The module to import.
+        repeat (int): How many fresh interpreters to time it in.
+
+    Returns:
+        dict: The measurement.
+    """
+    runs = [import_times(module) for _ in range(repeat)]
+    totals = [run[module] for run in runs]
+    median_run = runs[totals.index(sorted(totals)[len(totals) // 2])]
+    heaviest = sorted(((name, micros) for name, micros in median_run.items() if name != module),
+                      key=lambda item: item[1], reverse=True)[:15]
+    return {
+        "module": module,
+        "repeat": repeat,
+        "import_ms_median": round(statistics.median(totals) / 1000, 1),
+        "import_ms_min": round(min(totals) / 1000, 1),
+        "interpreter_start_ms": round(statistics.median(interpreter_start_seconds() for _ in range(repeat)) * 1000, 1),
+        "worker_start_ms": round(worker_start_seconds(module) * 1000, 1),
+        "forbidden_imported": [name for name in FORBIDDEN_MODULES if name in median_run],
+        "heaviest_ms": {name: round(micros / 1000, 1) for name, micros in heaviest},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Measure the import time of the report library against a budget.")
+    parser.add_argument("--module", default=DEFAULT_MODULE,
+                        help="The module to import (default: %(default)s).")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Fresh interpreters to time the import in (default: %(default)s).")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                        help="The budget for the median import time (default: %(default)s).")
+    parser.add_argument("--output", help="Write the JSON results to this file instead of stdout.")
+    args = parser.parse_args(argv)
+
+    result = measure(args.module, args.repeat)
+    within_budget = result["import_ms_median"] <= args.budget_ms and not result["forbidden_imported"]
+    print(f"import {args.module}: {result['import_ms_median']:.1f} ms median "
+          f"(budget {args.budget_ms:.0f} ms), worker start {result['worker_start_ms']:.1f} ms, "
+          f"interpreter start {result['interpreter_start_ms']:.1f} ms", file=sys.stderr)
+    if result["forbidden_imported"]:
+        print(f"imported eagerly: {', '.join(result['forbidden_imported'])}", file=sys.stderr)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "budget_ms": args.budget_ms,
+        "within_budget": within_budget,
+        "result": result,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    return 0 if within_budget else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
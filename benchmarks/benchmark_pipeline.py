@@ -0,0 +1,332 @@
+"""
+Benchmarks the 401k report pipeline on synthetic inputs.
+
+Generates a roster of the requested size together with requirements, general items
+and At a Glance workbooks, In Brief and fine print documents and header and footer
+images, then times the full pipeline and each stage on its own. Every measurement
+runs in a fresh process so its peak RSS is its own.
+
+Each measurement also gets its own empty Excel cache (SEF_EXCEL_CACHE), so the
+client_list and load_inputs stages are cold loads. Their _warm variants are measured
+after another process has filled that cache, as on a second run with the same workbooks.
+
+Usage:
+    python benchmarks/benchmark_pipeline.py
+    python benchmarks/benchmark_pipeline.py --clients 10 100 --stages pipeline build_reports --output results.json
+
+The results are written as JSON, so runs from different versions can be compared.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_CLIENTS = [10, 100, 1000, 5000]
+STAGES = ["pipeline", "load_inputs", "load_inputs_warm", "client_list", "client_list_warm",
+          "input_hashes", "shared_sections", "build_reports", "archive"]
+# The warm stages run the same code as these, once the Excel cache is filled
+WARM_SUFFIX = "_warm"
+
+
+# ************ START SYNTHETIC INPUTS ************ #
+
+
+def input_paths(directory):
+    """
+    Args:
+        directory (str): The folder with the generated inputs.
+
+    Returns:
+        dict: The path of each input, keyed by the name of main()'s argument.
+    """
+    return {
+        "clients_excel_file": os.path.join(directory, "clients.xlsx"),
+        "in_brief_file": os.path.join(directory, "in_brief.docx"),
+        "requirements_file_path": os.path.join(directory, "requirements.xlsx"),
+        "general_items_file_path": os.path.join(directory, "general_items.xlsx"),
+        "at_a_glance_excel_file": os.path.join(directory, "at_a_glance.xlsx"),
+        "at_a_glance_fine_print": os.path.join(directory, "fine_print.docx"),
+        "header_image_path": os.path.join(directory, "header.png"),
+        "footer_image_path": os.path.join(directory, "footer.png"),
+    }
+
+
+def generate_inputs(directory, clients, requirements_per_client=3, general_items_per_client=2, image_size=(2400, 330)):
+    """
+    Writes a complete set of synthetic inputs for main().
+
+    Every third client has no rows of their own, so the "No Individual ..." banners are
+    exercised too, and both workbooks have rows shared by all clients.
+
+    Args:
+        directory (str): The folder to write the inputs to.
+        clients (int): The number of clients in the roster.
+        requirements_per_client (int, optional): Requirement rows per client. Defaults to 3.
+        general_items_per_client (int, optional): General item rows per client. Defaults to 2.
+        image_size (tuple, optional): The pixel size of the header and footer images. Defaults to (2400, 330).
+
+    Returns:
+        dict: The path of each input, keyed by the name of main()'s argument.
+    """
+    import docx
+    import numpy as np
+    import pandas as pd
+    from PIL import Image
+
+    os.makedirs(directory, exist_ok=True)
+    names = [(f"Last{i:05d}", f"First{i:05d}") for i in range(clients)]
+    paths = input_paths(directory)
+
+    pd.DataFrame({"Last Name": [last for last, first in names],
+                  "First Name": [first for last, first in names]}).to_excel(paths["clients_excel_file"], index=False)
+
+    def client_rows(per_client, make_row):
+        rows = [make_row(last, first, k) for i, (last, first) in enumerate(names)
+                if i % 3 != 2 for k in range(per_client)]
+        rows.append(make_row("All", "All", 0))
+        rows.append(make_row("", "All", 1))
+        return pd.DataFrame(rows)
+
+    client_rows(requirements_per_client, lambda last, first, k: {
+        "Last Name": last, "First Name": first,
+        "Requirement": f"Requirement {k} for {first} {last}",
+        "Due": f"2021-{k % 12 + 1:02d}-15"}).to_excel(paths["requirements_file_path"], index=False)
+    client_rows(general_items_per_client, lambda last, first, k: {
+        "Last Name": last, "First Name": first,
+        "General Items": f"General item {k} for {first} {last}"}).to_excel(paths["general_items_file_path"], index=False)
+
+    rng = np.random.default_rng(0)
+    pd.DataFrame(np.round(rng.uniform(-5, 15, (6, 4)), 2),
+                 columns=["1 Yr", "3 Yr", "5 Yr", "10 Yr"]).to_excel(paths["at_a_glance_excel_file"], index=False)
+
+    for key, paragraphs in (("in_brief_file", 12), ("at_a_glance_fine_print", 4)):
+        doc = docx.Document()
+        doc.add_heading("Synthetic section", level=1)
+        for k in range(paragraphs):
+            paragraph = doc.add_paragraph()
+            paragraph.add_run(f"Paragraph {k}. ").bold = True
+            paragraph.add_run("Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 4)
+        table = doc.add_table(rows=3, cols=3, style="Table Grid")
+        for i, row in enumerate(table.rows):
+            for j, cell in enumerate(row.cells):
+                cell.text = f"{i},{j}"
+        doc.save(paths[key])
+
+    # A logo-like banner: a gradient with solid blocks of color
+    gradient = np.linspace(0, 255, image_size[0], dtype=np.uint8)
+    pixels = np.stack([np.tile(gradient, (image_size[1], 1)),
+                       np.full(image_size[::-1], 60, dtype=np.uint8),
+                       np.full(image_size[::-1], 120, dtype=np.uint8)], axis=-1)
+    for k in range(8):
+        x, y = rng.integers(0, image_size[0] * 3 // 4), rng.integers(0, image_size[1] // 2)
+        pixels[y:y + image_size[1] // 3, x:x + image_size[0] // 10] = rng.integers(0, 255, 3)
+    Image.fromarray(pixels).save(paths["header_image_path"])
+    Image.fromarray(pixels[:, ::-1]).save(paths["footer_image_path"])
+    return paths
+
+
+# ************ END SYNTHETIC INPUTS ************ #
+
+
+# ************ START MEASUREMENTS ************ #
+
+
+def peak_rss_bytes():
+    """
+    Returns:
+        int: The peak resident set size of this process and its finished children.
+    """
+    scale = 1 if sys.platform == "darwin" else 1024
+    return scale * max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                       resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+def run_stage(stage, clients, inputs_dir, workers):
+    """
+    Runs one stage on inputs made by generate_inputs in this process and measures it.
+    Everything the stage needs that is not part of it, including importing the library's
+    dependencies, is prepared before the clock starts.
+    A _warm stage runs the same code as the stage it is named after.
+
+    Args:
+        stage (str): One of STAGES.
+        clients (int): The roster size the inputs were generated for.
+        inputs_dir (str): The folder with the generated inputs.
+        workers (int): The number of worker processes for the stages that use them.
+
+    Returns:
+        dict: The measurement.
+    """
+    sys.path.insert(0, REPO_DIR)
+    import sef_reports
+
+    # The library imports these on first use. Load them before the clock starts, so the
+    # stages time the same work as before; benchmark_import.py measures the imports
+    for module in (sef_reports.pd, sef_reports.np, sef_reports.openpyxl, sef_reports.Image, sef_reports.ImageOps):
+        module.__name__
+
+    paths = input_paths(inputs_dir)
+    output_dir = tempfile.mkdtemp(prefix="sef_benchmark_output_")
+    load_args = (2021, 1, paths["in_brief_file"], paths["requirements_file_path"], paths["general_items_file_path"],
+                 paths["at_a_glance_excel_file"], paths["at_a_glance_fine_print"],
+                 paths["header_image_path"], paths["footer_image_path"])
+    output_bytes = None
+    action = stage.removesuffix(WARM_SUFFIX)
+    try:
+        # The stages after loading get the roster and inputs prepared (the upload cache
+        # would otherwise make the first two stages look free)
+        if action not in ("pipeline", "load_inputs", "client_list"):
+            file_paths, names = sef_reports.create_client_list(
+                output_dir, "Mac", paths["clients_excel_file"], 1, 2021)
+            inputs = sef_reports.load_report_inputs(*load_args)
+        if action == "archive":
+            report = sef_reports.build_client_report(
+                file_paths[0], names[0], inputs, write_to_disk=False)
+
+        start = time.perf_counter()
+        if action == "pipeline":
+            archive = sef_reports.ReportArchive()
+            sef_reports.main(2021, 1, output_dir, "Mac", paths["clients_excel_file"], *load_args[2:],
+                             workers=workers, archive=archive)
+            output_bytes = len(archive.close().read())
+        elif action == "load_inputs":
+            sef_reports.load_report_inputs(*load_args)
+        elif action == "client_list":
+            sef_reports.create_client_list(output_dir, "Mac",
+                                           paths["clients_excel_file"], 1, 2021)
+        elif action == "input_hashes":
+            sef_reports.client_input_hashes(file_paths, names, inputs)
+        elif action == "shared_sections":
+            sef_reports.SharedSections(inputs)
+        elif action == "build_reports":
+            output_bytes = 0
+            for result in sef_reports.iter_report_results(file_paths, names, inputs, workers=workers, write_to_disk=False):
+                output_bytes += len(result["data"])
+        elif action == "archive":
+            archive = sef_reports.ReportArchive()
+            for file_path in file_paths:
+                archive.add(file_path, report)
+            output_bytes = len(archive.close().read())
+        wall_seconds = time.perf_counter() - start
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    return {
+        "stage": stage,
+        "clients": clients,
+        "workers": workers,
+        "wall_seconds": round(wall_seconds, 4),
+        "seconds_per_client": round(wall_seconds / clients, 6),
+        "peak_rss_bytes": peak_rss_bytes(),
+        "output_bytes": output_bytes,
+        "output_bytes_per_client": round(output_bytes / clients) if output_bytes is not None else None,
+    }
+
+
+def run_stage_in_subprocess(stage, clients, inputs_dir, workers):
+    """
+    Runs run_stage in a fresh Python process, so peak RSS is measured per stage.
+
+    The process gets an empty Excel cache of its own, so nothing is carried over from
+    other stages or earlier benchmark runs. For a _warm stage, another process runs the
+    stage first to fill the cache.
+
+    Returns:
+        dict: The measurement, or the stage's error output if it failed.
+    """
+    cache_dir = tempfile.mkdtemp(prefix="sef_benchmark_excel_cache_")
+    env = dict(os.environ, SEF_EXCEL_CACHE=cache_dir)
+    try:
+        runs = [stage.removesuffix(WARM_SUFFIX), stage] if stage.endswith(WARM_SUFFIX) else [stage]
+        for run in runs:
+            completed = subprocess.run([sys.executable, os.path.abspath(__file__), "--run-one", run,
+                                        "--clients", str(clients), "--inputs-dir", inputs_dir,
+                                        "--workers", str(workers)],
+                                       capture_output=True, text=True, env=env)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    for line in reversed(completed.stdout.splitlines()):
+        if line.startswith("{"):
+            return json.loads(line)
+    return {"stage": stage, "clients": clients, "workers": workers,
+            "error": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else f"exit code {completed.returncode}"}
+
+
+def git_commit():
+    """
+    Returns:
+        str: The commit being benchmarked, or None outside a git checkout.
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ************ END MEASUREMENTS ************ #
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the 401k report pipeline on synthetic inputs.")
+    parser.add_argument("--clients", type=int, nargs="+", default=DEFAULT_CLIENTS,
+                        help="Roster sizes to benchmark (default: %(default)s).")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES,
+                        help="Stages to benchmark; 'pipeline' is main() end to end (default: all).")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes for the pipeline and build_reports stages (default: 1).")
+    parser.add_argument("--output", help="Write the JSON results to this file instead of stdout.")
+    parser.add_argument("--inputs-dir", help="Keep the generated inputs in this folder.")
+    parser.add_argument("--run-one", choices=STAGES, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_one:
+        print(json.dumps(run_stage(args.run_one,
+              args.clients[0], args.inputs_dir, args.workers)))
+        return 0
+
+    results = []
+    for clients in args.clients:
+        inputs_dir = os.path.join(args.inputs_dir, str(clients)) if args.inputs_dir else tempfile.mkdtemp(
+            prefix=f"sef_benchmark_inputs_{clients}_")
+        try:
+            generate_inputs(inputs_dir, clients)
+            for stage in args.stages:
+                result = run_stage_in_subprocess(
+                    stage, clients, inputs_dir, args.workers)
+                results.append(result)
+                print(f"{clients:>6} clients  {stage:<16} " + (
+                    f"{result['wall_seconds']:>9.3f} s  {result['peak_rss_bytes'] / 2 ** 20:>8.1f} MiB"
+                    if "error" not in result else f"failed: {result['error']}"), file=sys.stderr)
+        finally:
+            if not args.inputs_dir:
+                shutil.rmtree(inputs_dir, ignore_errors=True)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    return 0 if all("error" not in result for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
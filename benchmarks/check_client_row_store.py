@@ -0,0 +1,146 @@
+"""
+Checks that the client row store (--store) gives every client the same requirement and
+general item rows as the in-memory index, with the same column types and the same text
+in the report tables.
+
+By default the check runs on synthetic inputs (see benchmark_pipeline.generate_inputs)
+whose requirements end in a date column with some missing dates and a column of
+numbers with gaps, the two columns the report reads. Workbooks of your own can be
+checked instead.
+
+Usage:
+    python benchmarks/check_client_row_store.py
+    python benchmarks/check_client_row_store.py --clients clients.xlsx --requirements requirements.xlsx --general-items general_items.xlsx
+
+Exits with status 1 if any client's rows differ, so it can run as a check.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+from benchmark_pipeline import REPO_DIR, generate_inputs
+
+DEFAULT_CLIENTS = 60
+
+
+def add_typed_columns(requirements_file_path):
+    """
+    Rewrites a synthetic requirements workbook so its last two columns are a date column,
+    with every fifth date missing, and a column of numbers with gaps.
+
+    Args:
+        requirements_file_path (str): The workbook written by generate_inputs.
+    """
+    import pandas as pd
+
+    df = pd.read_excel(requirements_file_path)
+    due = pd.to_datetime(df["Due"])
+    due[df.index % 5 == 4] = pd.NaT
+    df["Due"] = due
+    df["Amount"] = [None if i % 4 == 3 else i * 12.5 for i in range(len(df))]
+    df.to_excel(requirements_file_path, index=False)
+
+
+def compare_rows(sheet, expected, actual):
+    """
+    Args:
+        sheet (str): The sheet, for the messages.
+        expected (pandas.DataFrame): A client's rows from the in-memory index.
+        actual (pandas.DataFrame): The same client's rows from the store.
+
+    Returns:
+        list: What differs, as messages. Empty if the rows are the same.
+    """
+    import sef_reports
+
+    problems = []
+    if list(expected.columns) != list(actual.columns):
+        return [f"{sheet}: columns {list(actual.columns)} instead of {list(expected.columns)}"]
+    if list(expected.index) != list(actual.index):
+        return [f"{sheet}: rows {list(actual.index)} instead of {list(expected.index)}"]
+    for column in expected.columns:
+        # The name columns are categoricals in memory and plain strings in the store
+        if column not in sef_reports.NAME_COLUMNS and expected[column].dtype != actual[column].dtype:
+            problems.append(
+                f"{sheet}: column {column!r} is {actual[column].dtype} instead of {expected[column].dtype}")
+    expected_text = sef_reports.format_dataframe(expected)
+    actual_text = sef_reports.format_dataframe(actual)
+    different = expected_text.ne(actual_text).any(axis=1)
+    for position in expected_text.index[different.to_numpy()]:
+        problems.append(f"{sheet}: row {position} reads {actual_text.loc[position].tolist()} "
+                        f"instead of {expected_text.loc[position].tolist()}")
+    return problems
+
+
+def check(clients_excel_file, requirements_file_path, general_items_file_path):
+    """
+    Loads both sheets into the in-memory index and into a new store, and compares every
+    client's rows, plus those of a client who is not in either sheet.
+
+    Returns:
+        list: What differs, as messages. Empty if the store matches the index.
+    """
+    sys.path.insert(0, REPO_DIR)
+    import sef_reports
+
+    store_dir = tempfile.mkdtemp(prefix="sef_store_check_")
+    store = sef_reports.ClientRowStore(os.path.join(store_dir, "check.store.sqlite3"))
+    problems = []
+    try:
+        _, names = sef_reports.create_client_list(
+            store_dir, "Mac", clients_excel_file, 1, 2021)
+        names.append(("Nobody", "Not In The Sheets"))
+        for sheet, source, schema in (("requirements", requirements_file_path, sef_reports.REQUIREMENTS_SCHEMA),
+                                      ("general_items", general_items_file_path, sef_reports.GENERAL_ITEMS_SCHEMA)):
+            index = sef_reports.load_client_row_index(source, schema)
+            stored = sef_reports.load_stored_client_rows(store, sheet, source, schema)
+            for last_name, first_name in names:
+                problems.extend(f"{last_name}, {first_name}: {problem}" for problem in compare_rows(
+                    sheet, index.rows_for(last_name, first_name), stored.rows_for(last_name, first_name)))
+    finally:
+        store.close()
+        shutil.rmtree(store_dir, ignore_errors=True)
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Check that the client row store matches the in-memory index.")
+    parser.add_argument("--clients", help="The clients workbook. Defaults to synthetic inputs.")
+    parser.add_argument("--requirements", help="The requirements workbook.")
+    parser.add_argument("--general-items", help="The general items workbook.")
+    parser.add_argument("--synthetic-clients", type=int, default=DEFAULT_CLIENTS,
+                        help="The roster size of the synthetic inputs (default: %(default)s).")
+    args = parser.parse_args(argv)
+
+    given = [args.clients, args.requirements, args.general_items]
+    if any(given) and not all(given):
+        parser.error("--clients, --requirements and --general-items go together")
+
+    inputs_dir = None
+    try:
+        if all(given):
+            problems = check(*given)
+        else:
+            inputs_dir = tempfile.mkdtemp(prefix="sef_store_check_inputs_")
+            paths = generate_inputs(inputs_dir, args.synthetic_clients)
+            add_typed_columns(paths["requirements_file_path"])
+            problems = check(paths["clients_excel_file"], paths["requirements_file_path"],
+                             paths["general_items_file_path"])
+    finally:
+        if inputs_dir is not None:
+            shutil.rmtree(inputs_dir, ignore_errors=True)
+
+    for problem in problems[:50]:
+        print(problem, file=sys.stderr)
+    if problems:
+        print(f"{len(problems)} difference(s) between the store and the in-memory index.", file=sys.stderr)
+        return 1
+    print("The store matches the in-memory index.", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,4349 @@
+"""
+Generates the SEFG 401(K) preliminary reports.
+
+This is the report generation library behind the Streamlit app in SEF.py. Importing it
+has no UI side effects, and it also runs on its own from the command line:
+`python sef_reports.py --help`.
+
+pandas, numpy, openpyxl and Pillow are only imported when they are first used, so that
+the command line and worker processes start quickly (see benchmarks/benchmark_import.py).
+Streamlit is never imported here; its caches are used when the app has loaded it.
+"""
+from __future__ import annotations
+
+import argparse
+import collections
+import concurrent.futures
+import contextlib
+import datetime
+import functools
+import hashlib
+import importlib
+import importlib.util
+import io
+import json
+import logging
+import math
+import ntpath
+import os
+import re
+import sqlite3
+import struct
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import tracemalloc
+import types
+import zlib
+from copy import deepcopy
+from dataclasses import dataclass, field, replace
+from html import escape as html_escape
+
+import docx
+from docx import Document
+from docx.enum.style import WD_STYLE_TYPE
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.opc.part import Part
+from docx.oxml import OxmlElement, parse_xml
+from docx.oxml.ns import nsdecls, qn
+from docx.text.font import Font
+
+
+def lazy_import(name):
+    """
+    Imports a module the first time one of its attributes is used, see
+    importlib.util.LazyLoader.
+
+    Args:
+        name (str): The module, e.g. "pandas".
+
+    Returns:
+        module: The module, loaded on first use.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+# Heavy dependencies that most imports of this module (and the command line's --help) never need
+pd = lazy_import("pandas")
+np = lazy_import("numpy")
+openpyxl = lazy_import("openpyxl")
+Image = lazy_import("PIL.Image")
+ImageOps = lazy_import("PIL.ImageOps")
+# Only needed when profiling
+cProfile = lazy_import("cProfile")
+pstats = lazy_import("pstats")
+
+
+# ************ START OVERALL HELPER FUNCTIONS ************ #
+
+
+# ************ CHECK IF FILE PATHS EXIST ************ #
+
+def check_file_exists(file_path):
+    """
+    Check if a file exists at the given file path.
+
+    Args:
+        file_path (str): The path of the file to check.
+
+    Returns:
+        bool: True if the file exists, False otherwise.
+    """
+    return os.path.isfile(file_path)
+
+
+# ************ START INSTRUMENTATION ************ #
+
+
+logger = logging.getLogger(__name__)
+
+# The counters every RunMetrics reports, even if they stay at zero
+METRIC_COUNTERS = ("documents_loaded", "documents_created",
+                   "documents_saved", "bytes_written")
+# How many functions each stage's profile lists, by cumulative time
+PROFILE_FUNCTIONS = 25
+
+# The RunMetrics each thread is recording into, see RunMetrics.activate
+_active_metrics = threading.local()
+
+
+def count_metric(name, amount=1):
+    """
+    Adds to one of the counters of the active RunMetrics. Does nothing if none is active.
+
+    Args:
+        name (str): The counter, see METRIC_COUNTERS.
+        amount (int, optional): How much to add. Defaults to 1.
+    """
+    metrics = getattr(_active_metrics, "metrics", None)
+    if metrics is not None:
+        metrics.count(name, amount)
+
+
+class RunMetrics:
+    """
+    Records where a run spends its time: the wall time of each stage and of each client's
+    report, how many documents were loaded, created and saved, the bytes written to disk
+    and, optionally, each stage's peak memory and a cProfile capture of each stage.
+
+    Stages nest. A stage's seconds include its nested stages, but its profile does not.
+    With enabled=False nothing is recorded, so the hooks cost next to nothing.
+
+    Args:
+        enabled (bool, optional): Record anything at all. Defaults to True.
+        profile (bool, optional): Capture a cProfile of each stage. Slows the run down. Defaults to False.
+        trace_memory (bool, optional): Record each stage's peak memory with tracemalloc. Slows
+            the run down. Defaults to False.
+
+    Attributes:
+        stages (dict): The 'calls', 'seconds' and 'peak_memory_bytes' of each stage, by name.
+        clients (dict): The seconds each client's report took to build, by file path.
+        counters (dict): See METRIC_COUNTERS.
+        profiles (dict): The raw cProfile stats of each stage, by name.
+    """
+
+    def __init__(self, enabled=True, profile=False, trace_memory=False):
+        self.enabled = enabled
+        self.profile = enabled and profile
+        self.trace_memory = enabled and trace_memory
+        self.stages = {}
+        self.clients = {}
+        self.counters = dict.fromkeys(METRIC_COUNTERS, 0)
+        self.profiles = {}
+        # The stages currently running, innermost last
+        self._open_stages = []
+
+    def __getstate__(self):
+        # Running stages hold profilers, which cannot be sent between processes
+        state = self.__dict__.copy()
+        state["_open_stages"] = []
+        return state
+
+    def options(self):
+        """
+        Returns:
+            dict: The arguments that create an empty RunMetrics recording the same things,
+            e.g. in a worker process.
+        """
+        return {"enabled": self.enabled, "profile": self.profile, "trace_memory": self.trace_memory}
+
+    @contextlib.contextmanager
+    def activate(self):
+        """
+        Makes this the RunMetrics that count_metric adds to in this thread while the block runs.
+        """
+        previous = getattr(_active_metrics, "metrics", None)
+        _active_metrics.metrics = self if self.enabled else None
+        try:
+            yield self
+        finally:
+            _active_metrics.metrics = previous
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Times the block as one call of a stage.
+
+        Args:
+            name (str): The stage, e.g. "load inputs".
+        """
+        if not self.enabled:
+            yield
+            return
+        self._start(name, sequential=False)
+        try:
+            yield
+        finally:
+            self._stop()
+
+    def enter(self, name):
+        """
+        Ends the stage started by the last enter(), if it is still running, and starts the
+        next one, for code that moves through a sequence of stages. Call leave() after the last.
+
+        Args:
+            name (str): The stage, e.g. "requirements".
+
+        Returns:
+            str: name, so the caller can keep track of the stage it is in.
+        """
+        if self.enabled:
+            self.leave()
+            self._start(name, sequential=True)
+        return name
+
+    def leave(self):
+        """
+        Ends the stage started by the last enter(), if it is still running.
+        """
+        if self._open_stages and self._open_stages[-1]["sequential"]:
+            self._stop()
+
+    def current_stage(self):
+        """
+        Returns:
+            str: The innermost stage running right now, or None. Safe to call from another
+            thread while the run is going.
+        """
+        open_stages = list(self._open_stages)
+        return open_stages[-1]["name"] if open_stages else None
+
+    def _start(self, name, sequential):
+        parent = self._open_stages[-1] if self._open_stages else None
+        if parent is not None and parent["profiler"] is not None:
+            parent["profiler"].disable()
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            if parent is not None:
+                parent["peak"] = max(
+                    parent["peak"], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        profiler = None
+        if self.profile:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        self._open_stages.append({"name": name, "sequential": sequential, "profiler": profiler,
+                                  "peak": 0, "start": time.perf_counter()})
+
+    def _stop(self):
+        frame = self._open_stages.pop()
+        seconds = time.perf_counter() - frame["start"]
+        peak = None
+        if frame["profiler"] is not None:
+            frame["profiler"].disable()
+            frame["profiler"].create_stats()
+            self.add_profile(frame["name"], frame["profiler"].stats)
+        if self.trace_memory:
+            peak = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+        parent = self._open_stages[-1] if self._open_stages else None
+        if parent is not None:
+            if peak is not None:
+                parent["peak"] = max(parent["peak"], peak)
+            if parent["profiler"] is not None:
+                parent["profiler"].enable()
+        self.add_stage(frame["name"], seconds, peak)
+
+    def add_stage(self, name, seconds, peak_memory_bytes=None, calls=1):
+        """
+        Records one or more calls of a stage.
+
+        Args:
+            name (str): The stage.
+            seconds (float): Their wall time.
+            peak_memory_bytes (int, optional): Their peak memory, if it was traced. Defaults to None.
+            calls (int, optional): How many calls. Defaults to 1.
+        """
+        totals = self.stages.setdefault(
+            name, {"calls": 0, "seconds": 0.0, "peak_memory_bytes": None})
+        totals["calls"] += calls
+        totals["seconds"] += seconds
+        if peak_memory_bytes is not None:
+            totals["peak_memory_bytes"] = max(
+                totals["peak_memory_bytes"] or 0, peak_memory_bytes)
+
+    def add_profile(self, name, stats):
+        """
+        Adds raw cProfile stats to a stage's profile.
+
+        Args:
+            name (str): The stage.
+            stats (dict): The stats, as in cProfile.Profile.stats.
+        """
+        totals = self.profiles.setdefault(name, {})
+        for function, function_stats in stats.items():
+            if function in totals:
+                totals[function] = pstats.add_func_stats(
+                    totals[function], function_stats)
+            else:
+                totals[function] = function_stats
+
+    def count(self, name, amount=1):
+        """
+        Adds to one of the counters, see count_metric.
+        """
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def merge(self, other):
+        """
+        Adds everything another RunMetrics recorded, e.g. in a worker process, to this one.
+
+        Args:
+            other (RunMetrics): The metrics to add.
+        """
+        for name, totals in other.stages.items():
+            self.add_stage(name, totals["seconds"],
+                           totals["peak_memory_bytes"], calls=totals["calls"])
+        self.clients.update(other.clients)
+        for name, amount in other.counters.items():
+            self.count(name, amount)
+        for name, stats in other.profiles.items():
+            self.add_profile(name, stats)
+
+    def profile_text(self, name, limit=PROFILE_FUNCTIONS):
+        """
+        Args:
+            name (str): The stage.
+            limit (int, optional): How many functions to list. Defaults to PROFILE_FUNCTIONS.
+
+        Returns:
+            str: The stage's profile as printed by pstats, sorted by cumulative time.
+        """
+        stream = io.StringIO()
+        # pstats takes over the stats of whatever it loads, so give it a copy
+        source = types.SimpleNamespace(
+            stats=dict(self.profiles[name]), create_stats=lambda: None)
+        pstats.Stats(source, stream=stream).sort_stats(
+            "cumulative").print_stats(limit)
+        return stream.getvalue()
+
+    def stage_table(self):
+        """
+        Returns:
+            pandas.DataFrame: One row per stage with its calls, total and average seconds
+            and peak memory, slowest first.
+        """
+        rows = [{"Stage": name,
+                 "Calls": totals["calls"],
+                 "Seconds": round(totals["seconds"], 3),
+                 "Seconds per call": round(totals["seconds"] / totals["calls"], 4),
+                 "Peak memory (MB)": None if totals["peak_memory_bytes"] is None else round(totals["peak_memory_bytes"] / 1e6, 1)}
+                for name, totals in list(self.stages.items())]
+        columns = ["Stage", "Calls", "Seconds",
+                   "Seconds per call", "Peak memory (MB)"]
+        return pd.DataFrame(rows, columns=columns).sort_values("Seconds", ascending=False, ignore_index=True)
+
+    def to_dict(self):
+        """
+        Returns:
+            dict: Everything recorded, ready for json.dumps. Profiles are included as text.
+        """
+        return {"stages": self.stages,
+                "clients": self.clients,
+                "counters": self.counters,
+                "profiles": {name: self.profile_text(name) for name in self.profiles}}
+
+    def to_json(self):
+        """
+        Returns:
+            str: See to_dict.
+        """
+        return json.dumps(self.to_dict(), indent=2)
+
+    def save(self, path):
+        """
+        Writes the metrics to a JSON file.
+
+        Args:
+            path (str): The path of the JSON file.
+        """
+        write_file_atomically(path, self.to_json().encode("utf-8"))
+
+
+# ************ END INSTRUMENTATION ************ #
+
+
+# ************ START REPORT SESSION ************ #
+
+
+# The only styles new documents start with; the named report styles and any style a
+# copied document uses are added on demand
+BASE_TEMPLATE_STYLES = ('Normal', 'Default Paragraph Font', 'Normal Table', 'No List',
+                        'List Number', 'List Bullet', 'Table Grid')
+# Parts of python-docx's default template the reports never use
+UNUSED_TEMPLATE_RELATIONSHIPS = (
+    RT.CUSTOM_XML, RT.WEB_SETTINGS, RT.THUMBNAIL,
+    "http://schemas.microsoft.com/office/2007/relationships/stylesWithEffects",
+)
+
+
+@functools.lru_cache(maxsize=None)
+def base_template_bytes():
+    """
+    Builds the template every new report starts from, once per process: python-docx's
+    default template with only BASE_TEMPLATE_STYLES (and the styles they are based on)
+    and without its latent style list, style effects, web settings, custom XML and
+    thumbnail.
+
+    Returns:
+        bytes: The template as a .docx file.
+    """
+    doc = docx.Document()
+    styles = doc.styles.element
+    keep = set()
+    pending = [doc.styles[name].style_id for name in BASE_TEMPLATE_STYLES]
+    while pending:
+        style_id = pending.pop()
+        if style_id in keep:
+            continue
+        keep.add(style_id)
+        pending.extend(styles.get_by_id(style_id).xpath(
+            './w:basedOn/@w:val | ./w:next/@w:val | ./w:link/@w:val'))
+    for style in styles.xpath('./w:style'):
+        if style.get(qn('w:styleId')) not in keep:
+            styles.remove(style)
+    for latent_styles in styles.xpath('./w:latentStyles'):
+        styles.remove(latent_styles)
+
+    for rels in (doc.part.rels, doc.part.package.rels):
+        for rId, rel in list(rels.items()):
+            if rel.reltype in UNUSED_TEMPLATE_RELATIONSHIPS:
+                rels.pop(rId)
+
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def new_document():
+    """
+    Returns:
+        docx.document.Document: A new, empty document opened from the cached base template.
+    """
+    return docx.Document(io.BytesIO(base_template_bytes()))
+
+
+class ReportSession:
+    """
+    Holds a single Word document in memory so that every section stage for a
+    client can be applied to it before it is written back to disk once.
+
+    The file path helpers further down (insert_paragraph_with_font_style,
+    create_table, add_blank_line, ...) open a session, call the matching
+    method and save, so they keep working for one-off edits.
+
+    Args:
+        file_path (str): The path of the Word document.
+        new (bool, optional): Start from a blank document (see new_document) instead of loading file_path. Defaults to False.
+    """
+
+    def __init__(self, file_path, new=False):
+        self.file_path = file_path
+        if new:
+            self.doc = new_document()
+            count_metric("documents_created")
+        else:
+            self.doc = docx.Document(file_path)
+            count_metric("documents_loaded")
+        # Named styles already added to this document's styles.xml
+        self.defined_styles = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Only write the document back if every stage completed
+        if exc_type is None:
+            self.save()
+        return False
+
+    def story_container(self, story):
+        """
+        Finds the element and part that hold one of the document's stories.
+
+        Args:
+            story (str): 'body', or the 'header' or 'footer' of the first section.
+
+        Returns:
+            tuple: The w:body, w:hdr or w:ftr element and the story part that owns it.
+        """
+        if story == "header":
+            header = self.doc.sections[0].header
+            return header._element, header.part
+        if story == "footer":
+            footer = self.doc.sections[0].footer
+            return footer._element, footer.part
+        return self.doc.element.body, self.doc.part
+
+    def insert_fragment(self, fragment):
+        """
+        Copies a pre-rendered SectionFragment onto the end of its story.
+
+        Args:
+            fragment (SectionFragment): The section to copy in.
+        """
+        container, part = self.story_container(fragment.story)
+        before = container.sectPr if fragment.story == "body" else None
+        fragment.clone_into(container, part, before=before)
+
+    def save(self):
+        """
+        Saves the in-memory document to its file path, creating the parent directory if needed.
+        The file is replaced in one step, so it is never left half-written.
+        """
+        write_file_atomically(self.file_path, self.to_bytes())
+
+    def to_bytes(self):
+        """
+        Serializes the in-memory document without touching the disk.
+
+        Returns:
+            bytes: The .docx file.
+        """
+        buffer = io.BytesIO()
+        self.doc.save(buffer)
+        count_metric("documents_saved")
+        return buffer.getvalue()
+
+    # ************ PARAGRAPHS ************ #
+
+    def style(self, report_style):
+        """
+        Looks up one of the report's styles, defining it in this document the first
+        time it is used.
+
+        Args:
+            report_style (str or ReportStyle): The name of a style in REPORT_STYLES, or a
+                style made by report_style_for.
+
+        Returns:
+            str: The style name, ready to pass to python-docx.
+        """
+        if isinstance(report_style, str):
+            report_style = REPORT_STYLES[report_style]
+        if report_style.name not in self.defined_styles:
+            add_report_style(self.doc, report_style)
+            self.defined_styles.add(report_style.name)
+        return report_style.name
+
+    def insert_styled_paragraph(self, text, style_name):
+        """
+        Inserts a paragraph that uses one of the report's named styles.
+
+        Args:
+            text (str): The text to be inserted as a paragraph.
+            style_name (str or ReportStyle): The name of a style in REPORT_STYLES, e.g.
+                "Section Heading", or a style made by report_style_for.
+        """
+        self.doc.add_paragraph(text, style=self.style(style_name))
+
+    def insert_paragraph_with_font_style(self, text, font_size, font_style, font_color, header=False, highlight=False):
+        """
+        Inserts a paragraph with specified font style. See insert_paragraph_with_font_style.
+        """
+        font_color = str(docx.shared.RGBColor(
+            font_color[0], font_color[1], font_color[2]))
+        style = report_style_for(font_size, font_style, font_color, bold=True if header else None,
+                                 highlight=highlight if highlight in HIGHLIGHT_COLORS else None)
+        self.insert_styled_paragraph(text, style)
+
+    def copy_text_with_design_from_word_doc(self, source_file):
+        """
+        Copies the body of another Word document, with its design, onto the end of this one.
+        See copy_text_with_design_from_word_doc.
+        """
+        self.insert_fragment(SectionFragment.from_document(source_file))
+
+    def create_bulleted_list(self, items: list, start_index=None, font_size=None, font_color=None, font_style=None):
+        """
+        Creates a bulleted list. See create_bulleted_list.
+        """
+        logger.debug("Bulleted list for %s: %s", self.file_path, items)
+        for i in range(len(items)):
+            paragraph = self.doc.add_paragraph()
+            run = paragraph.add_run(items[i])
+            if font_size is not None or font_color is not None or font_style is not None:
+                run.style = self.style(report_style_for(
+                    font_size, font_style, font_color, style_type=WD_STYLE_TYPE.CHARACTER))
+            if start_index is not None:
+                if i >= start_index:
+                    paragraph.style = 'List Bullet'
+            else:
+                paragraph.style = 'List Bullet'
+
+    def create_numbered_list(self, general_items_list):
+        """
+        Adds each item as a 'List Number' paragraph. See create_numbered_list.
+        """
+        for item in general_items_list:
+            self.doc.add_paragraph(item, style='List Number')
+
+    def add_blank_line(self):
+        """
+        Adds a blank line to the end of the document.
+        """
+        self.doc.add_paragraph()
+
+    def insert_page_break(self):
+        """
+        Inserts a page break at the end of the document.
+        """
+        self.doc.add_page_break()
+
+    # ************ TABLES ************ #
+
+    def bold_first_row(self, table_number):
+        """
+        Bolds the first row of a table. See bold_first_row.
+        """
+        apply_table_style(
+            self.doc.tables[table_number], TableStyle(header_bold=True))
+
+    def make_bold(self, row, column, table_number):
+        """
+        Makes the text in a specific cell of a table bold. See make_bold.
+        """
+        apply_table_style(self.doc.tables[table_number], TableStyle(
+            cell_overrides={(row, column): CellStyle(bold=True)}))
+
+    def color_alternate_rows(self, color_code, table_number):
+        """
+        Colors alternate rows of a table. See color_alternate_rows.
+        """
+        apply_table_style(
+            self.doc.tables[table_number], TableStyle(band_fill=color_code))
+
+    def color_header(self, color_code, table_number):
+        """
+        Colors the header cells of a table. See color_header.
+        """
+        apply_table_style(
+            self.doc.tables[table_number], TableStyle(header_fill=color_code))
+
+    def highlight_first_row(self, rgb_color, table_number):
+        """
+        Shades the first row of a table and colors its text white. See highlight_first_row.
+        """
+        apply_table_style(self.doc.tables[table_number], TableStyle(
+            header_fill=rgb_color, header_font_color="FFFFFF"))
+
+    def make_first_row_bold(self, table_number):
+        """
+        Makes the first row of a table bold. See make_first_row_bold.
+        """
+        apply_table_style(
+            self.doc.tables[table_number], TableStyle(header_bold=True))
+
+    def create_table(self, df, shade_color):
+        """
+        Creates a table from the provided DataFrame. See create_table.
+        """
+        self.add_styled_table(df, TableStyle(
+            header_fill=shade_color, band_fill=shade_color))
+
+    def add_styled_table(self, df, table_style):
+        """
+        Adds a 'Table Grid' table built from a DataFrame, already formatted with table_style.
+
+        Args:
+            df (pandas.DataFrame): The DataFrame containing the data for the table.
+            table_style (TableStyle): The header, banding and cell formatting.
+        """
+        section = self.doc.sections[-1]
+        block_width = section.page_width - section.left_margin - section.right_margin
+        tbl = table_element_from_df(
+            df, block_width, self.doc.styles['Table Grid'].style_id, table_style)
+        self.doc.element.body._insert_tbl(tbl)
+        self.doc.styles['Normal'].font.name = 'Calibri'
+
+    # ************ MARGINS ************ #
+
+    def change_margins(self, top, bottom, left, right):
+        """
+        Changes the margins of every section. See change_margins.
+        """
+        for section in self.doc.sections:
+            section.top_margin = top
+            section.bottom_margin = bottom
+            section.left_margin = left
+            section.right_margin = right
+
+    def change_header_margins(self, top, bottom, left, right):
+        """
+        Changes the header margins of the first section. See change_header_margins.
+        """
+        header = self.doc.sections[0].header
+        header.top_margin = top
+        header.bottom_margin = bottom
+        header.left_margin = left
+        header.right_margin = right
+
+    # ************ HEADER AND FOOTER ************ #
+
+    def add_image_to_header(self, image_path):
+        """
+        Adds an image to the header of the first section. See add_image_to_header.
+        """
+        logger.debug("Adding the header image to %s", self.file_path)
+        header = self.doc.sections[0].header
+        for para in header.paragraphs:
+            del para
+        paragraph = header.add_paragraph()
+        run = paragraph.add_run()
+        run.alignment = docx.enum.text.WD_ALIGN_PARAGRAPH.CENTER
+        run.add_picture(io.BytesIO(prepare_report_image(read_input_bytes(image_path), *REPORT_IMAGE_SIZE)),
+                        width=docx.shared.Inches(REPORT_IMAGE_SIZE[0]), height=docx.shared.Inches(REPORT_IMAGE_SIZE[1]))
+
+    def add_image_to_footer(self, image_path):
+        """
+        Adds an image to the footer of the first section. See add_image_to_footer.
+        """
+        footer = self.doc.sections[0].footer
+        for para in footer.paragraphs:
+            del para
+        paragraph = footer.add_paragraph()
+        run = paragraph.add_run()
+        run.alignment = docx.enum.text.WD_ALIGN_PARAGRAPH.CENTER
+        run.add_picture(io.BytesIO(prepare_report_image(read_input_bytes(image_path), *REPORT_IMAGE_SIZE)),
+                        width=docx.shared.Inches(REPORT_IMAGE_SIZE[0]), height=docx.shared.Inches(REPORT_IMAGE_SIZE[1]))
+
+    # ************ REPORT SECTIONS ************ #
+
+    def insert_401k_title(self):
+        """
+        Inserts the 401k report title, derived from the file name. See insert_401k_titles.
+        """
+        self.add_blank_line()
+        self.insert_styled_paragraph(
+            f'{self.file_path.split("/")[-1][:-5]}', "Report Title")
+
+    def add_in_brief(self, in_brief_file):
+        """
+        Adds the in brief information from a Word document. See add_in_brief.
+        """
+        self.copy_text_with_design_from_word_doc(in_brief_file)
+
+    def add_relevent_points_of_interest_title(self):
+        """
+        Inserts the 'RELEVENT POINTS OF INTEREST' section title.
+        """
+        self.insert_styled_paragraph(
+            'RELEVENT POINTS OF INTEREST', "Section Heading")
+
+    def requirements_df_to_word(self, df, row_color, year, quarter, header_color=None):
+        """
+        Writes the requirements title and table. See requirements_df_to_word.
+        """
+        logger.debug("Requirements for %s:\n%s", self.file_path, df)
+        new_df = df.iloc[:, -2:]
+        self.insert_styled_paragraph(
+            f'{year} Q{quarter} REQUIREMENTS', "Table Heading")
+        table_style = replace(REPORT_TABLE_STYLE, band_fill=row_color)
+        if header_color is not None:
+            table_style.header_fill = header_color
+        self.add_styled_table(new_df, table_style)
+
+    def add_requirements_table(self, client_name, requirements_index, row_color, year, quarter, header_color=None):
+        """
+        Adds the requirements table for one client. See add_requirements_table.
+
+        Args:
+            client_name (list): The client's [last name, first name].
+            requirements_index (ClientRowIndex): The requirements sheet, grouped by client.
+        """
+        augmented_df = requirements_index.rows_for(
+            client_name[0], client_name[1])
+        shorted_df = requirements_index.shared_rows()
+        if len(augmented_df) == len(shorted_df):
+            self.insert_styled_paragraph(
+                f"No Individual Requirements Found For {client_name[0]}, {client_name[1]}. Add Manually!!", "Warning Banner")
+        if len(shorted_df) == 0:
+            self.insert_styled_paragraph(
+                f"No Requirement Found That Are To Be Assigned to All Clients. Add Manually Or Rerun The System With an Updated Excel File With Primary Requirements!!", "Warning Banner")
+
+        self.requirements_df_to_word(
+            augmented_df, row_color, year, quarter, header_color)
+
+    def insert_general_items_bulleted_list(self, client_name, general_items_index, font_size=None, font_color=None, font_style=None):
+        """
+        Inserts the general items list for one client. See insert_general_items_bulleted_list.
+
+        Args:
+            client_name (list): The client's [last name, first name].
+            general_items_index (ClientRowIndex): The general items sheet, grouped by client.
+        """
+        self.add_general_items_title()
+        self.add_general_items(client_name, general_items_index, font_size=font_size,
+                               font_color=font_color, font_style=font_style)
+
+    def add_general_items_title(self):
+        """
+        Inserts the 'GENERAL ITEMS' section title.
+        """
+        self.insert_styled_paragraph('GENERAL ITEMS', "Section Heading")
+
+    def add_general_items(self, client_name, general_items_index, font_size=None, font_color=None, font_style=None):
+        """
+        Inserts one client's general items, without the section title.
+        """
+        augmented_df = general_items_index.rows_for(
+            client_name[0], client_name[1])
+        shorted_df = general_items_index.shared_rows()
+        if len(augmented_df) == len(shorted_df):
+            self.insert_styled_paragraph(
+                f"No Individual General Items Found For {client_name[0]}, {client_name[1]}", "Warning Banner")
+        if len(shorted_df) == 0:
+            self.insert_styled_paragraph(
+                f"No General Items Found For All Clients. Add Manually Or Rerun The System With an Updated Excel File With Primary Requirements!!", "Warning Banner")
+
+        items_to_add = augmented_df['General Items'].tolist()
+        self.create_numbered_list(items_to_add)
+
+        # self.create_bulleted_list(augmented_df['General Items'].tolist(
+        # ), font_size=font_size, font_color=font_color, font_style=font_style)
+
+    def create_at_a_glance_table(self, at_a_glance_df, shade_color):
+        """
+        Creates the "at a glance" table. See create_at_a_glance_table.
+        """
+        logger.debug("At a glance table for %s:\n%s",
+                     self.file_path, at_a_glance_df)
+        self.add_styled_table(at_a_glance_df, replace(
+            REPORT_TABLE_STYLE, band_fill=shade_color))
+
+    def insert_at_a_glance(self, at_a_glance_df, at_a_glance_fine_print, quarter, year, shade_color):
+        """
+        Inserts the 'At a Glance' section. See insert_at_a_glance.
+
+        Args:
+            at_a_glance_df (pandas.DataFrame): The 'At a Glance' data, already formatted with percent signs.
+        """
+        self.insert_styled_paragraph(
+            f'{year} Q{quarter} AT A GLANCE', "Section Heading")
+        self.create_at_a_glance_table(at_a_glance_df, shade_color)
+        self.insert_styled_paragraph(' ', "Spacer")
+        self.copy_text_with_design_from_word_doc(at_a_glance_fine_print)
+
+
+# ************ END REPORT SESSION ************ #
+
+
+# ************ START SHARED SECTION FRAGMENTS ************ #
+
+
+RELATIONSHIP_NAMESPACE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+
+
+class SectionFragment:
+    """
+    A section rendered once into a prototype document and kept as OOXML, so it can be
+    deep-copied into every client's report instead of being rebuilt run by run.
+
+    Use SectionFragment.render to create one and ReportSession.insert_fragment to copy
+    it into a report. Relationships (images, hyperlinks, other parts), list numbering
+    and styles referenced by the elements are copied across with them.
+
+    Args:
+        elements (list): The rendered block-level elements, such as w:p and w:tbl.
+        part (docx.opc.part.Part): The story part the elements were rendered into.
+        story (str): Where the fragment goes in a report: 'body', 'header' or 'footer'.
+    """
+
+    def __init__(self, elements, part, story="body"):
+        self.elements = elements
+        self.part = part
+        self.story = story
+        self.style_ids = {
+            node.get(qn('w:val')) for element in elements
+            for node in element.iter(qn('w:pStyle'), qn('w:rStyle'), qn('w:tblStyle'))}
+
+    @classmethod
+    def render(cls, render, story="body"):
+        """
+        Renders a section into a blank prototype document and keeps the elements it added.
+
+        Args:
+            render (callable): Called with a ReportSession to add the section's content.
+            story (str, optional): 'body', 'header' or 'footer' of the first section. Defaults to "body".
+
+        Returns:
+            SectionFragment: The rendered section.
+        """
+        session = ReportSession(None, new=True)
+        container, part = session.story_container(story)
+        before = list(container)
+        before_ids = {id(element) for element in before}
+        render(session)
+        elements = [element for element in container
+                    if id(element) not in before_ids and element.tag != qn('w:sectPr')]
+        return cls(elements, part, story)
+
+    @classmethod
+    def from_document(cls, source_file):
+        """
+        Takes the whole body of a Word document (paragraphs, tables, images and lists) as
+        a fragment.
+
+        Each distinct document is only parsed once: fragments are cached by the file's
+        contents (see parse_document_upload), so the same upload is reused for every
+        client and across reruns of the app.
+
+        Args:
+            source_file (str or file-like): The path of the Word document, or an open file.
+
+        Returns:
+            SectionFragment: The document's body.
+        """
+        return parse_document_upload(read_input_bytes(source_file))
+
+    def clone_into(self, container, part, before=None):
+        """
+        Deep-copies the fragment into another document.
+
+        Args:
+            container (lxml.etree._Element): The w:body, w:hdr or w:ftr element to add to.
+            part (docx.opc.part.Part): The story part that owns container.
+            before (lxml.etree._Element, optional): Insert ahead of this element instead of appending, e.g. the body's w:sectPr. Defaults to None.
+        """
+        rIds = {}
+        copied_parts = {}
+        numIds = {}
+        self._copy_styles(part)
+        for element in self.elements:
+            clone = deepcopy(element)
+            for node in clone.iter():
+                for name, value in node.attrib.items():
+                    if name.startswith(f"{{{RELATIONSHIP_NAMESPACE}}}"):
+                        if value not in rIds:
+                            rIds[value] = self._copy_relationship(
+                                value, part, copied_parts)
+                        node.set(name, rIds[value])
+            for numId in clone.iter(qn('w:numId')):
+                value = numId.get(qn('w:val'))
+                if value != '0':
+                    if value not in numIds:
+                        numIds[value] = self._copy_numbering(value, part)
+                    numId.set(qn('w:val'), numIds[value])
+            if before is not None:
+                before.addprevious(clone)
+            else:
+                container.append(clone)
+
+    def _copy_relationship(self, rId, part, copied_parts):
+        """
+        Recreates one of the fragment's relationships on the destination part.
+
+        Returns:
+            str: The rId of the relationship on the destination part.
+        """
+        rel = self.part.rels[rId]
+        if rel.is_external:
+            return part.relate_to(rel.target_ref, rel.reltype, is_external=True)
+        if rel.reltype == RT.IMAGE:
+            # Reuses an identical image already in the destination package
+            return part.get_or_add_image(io.BytesIO(rel.target_part.blob))[0]
+        return part.relate_to(copy_part(rel.target_part, part.package, copied_parts), rel.reltype)
+
+    def _copy_numbering(self, numId, part):
+        """
+        Copies a list's numbering definition into the destination document.
+
+        Returns:
+            str: The numId of the copy in the destination document.
+        """
+        try:
+            source_numbering = self.part.package.main_document_part.part_related_by(
+                RT.NUMBERING).element
+        except KeyError:
+            return numId
+        try:
+            source_num = source_numbering.num_having_numId(int(numId))
+        except KeyError:
+            return numId
+        abstract_id = source_num.abstractNumId.val
+        source_abstract = source_numbering.xpath(
+            f'./w:abstractNum[@w:abstractNumId="{abstract_id}"]')[0]
+
+        numbering = part.package.main_document_part.numbering_part.element
+        abstract_ids = [int(value) for value in numbering.xpath(
+            './w:abstractNum/@w:abstractNumId')]
+        abstract = deepcopy(source_abstract)
+        abstract.set(qn('w:abstractNumId'), str(
+            max(abstract_ids, default=-1) + 1))
+        # Every w:abstractNum has to come before the first w:num
+        nums = numbering.xpath('./w:num')
+        if nums:
+            nums[0].addprevious(abstract)
+        else:
+            numbering.append(abstract)
+        num = numbering.add_num(int(abstract.get(qn('w:abstractNumId'))))
+        for override in source_num.xpath('./w:lvlOverride'):
+            num.append(deepcopy(override))
+        return str(num.numId)
+
+    def _copy_styles(self, part):
+        """
+        Copies any style the fragment uses that the destination document does not define,
+        along with the styles it is based on.
+        """
+        source_styles = self.part.package.main_document_part.styles.element
+        styles = part.package.main_document_part.styles.element
+        pending = list(self.style_ids)
+        while pending:
+            style_id = pending.pop()
+            if style_id is None or styles.get_by_id(style_id) is not None:
+                continue
+            style = source_styles.get_by_id(style_id)
+            if style is None:
+                continue
+            styles.append(deepcopy(style))
+            for related in style.xpath('./w:basedOn/@w:val | ./w:next/@w:val | ./w:link/@w:val'):
+                pending.append(related)
+
+
+def copy_part(source_part, package, copied_parts):
+    """
+    Copies a package part, and everything it relates to, into another package.
+
+    Args:
+        source_part (docx.opc.part.Part): The part to copy.
+        package (docx.opc.package.OpcPackage): The package to copy it into.
+        copied_parts (dict): Parts already copied during this operation, so shared targets are only copied once.
+
+    Returns:
+        docx.opc.part.Part: The copy.
+    """
+    if source_part in copied_parts:
+        return copied_parts[source_part]
+    # e.g. /word/charts/chart1.xml -> /word/charts/chart%d.xml
+    template = re.sub(r'\d*(\.[^./]+)$', r'%d\1', str(source_part.partname))
+    new_part = Part(package.next_partname(template),
+                    source_part.content_type, source_part.blob, package)
+    copied_parts[source_part] = new_part
+    for rId, rel in source_part.rels.items():
+        target = rel.target_ref if rel.is_external else copy_part(
+            rel.target_part, package, copied_parts)
+        new_part.load_rel(rel.reltype, target, rId, rel.is_external)
+    return new_part
+
+
+class SharedSections:
+    """
+    The sections that are identical in every client's report, rendered once as
+    SectionFragments: the In Brief block and its section title, the General Items title,
+    the whole At-a-Glance section and the header and footer images.
+
+    Args:
+        inputs (ReportInputs): The inputs shared by every client's report.
+    """
+
+    def __init__(self, inputs):
+        def render_in_brief(session):
+            session.add_in_brief(io.BytesIO(inputs.in_brief))
+            session.insert_page_break()
+            session.add_relevent_points_of_interest_title()
+
+        def render_general_items_title(session):
+            session.add_blank_line()
+            session.add_general_items_title()
+
+        def render_at_a_glance(session):
+            session.add_blank_line()
+            session.insert_at_a_glance(inputs.at_a_glance_df, io.BytesIO(
+                inputs.at_a_glance_fine_print), inputs.quarter, inputs.year, "F0F0F0")
+
+        self.in_brief = SectionFragment.render(render_in_brief)
+        self.general_items_title = SectionFragment.render(
+            render_general_items_title)
+        self.at_a_glance = SectionFragment.render(render_at_a_glance)
+        self.header = render_image_story(inputs.header_image, "header")
+        self.footer = render_image_story(inputs.footer_image, "footer")
+
+
+# ************ END SHARED SECTION FRAGMENTS ************ #
+
+
+# ************ START EXCEL INGESTION ************ #
+
+
+@dataclass(frozen=True)
+class ExcelSchema:
+    """
+    The columns of an Excel input that the report stages use, and how to read them.
+    Reading only these columns, with their types given up front, is much faster on
+    large sheets than reading every column as objects.
+
+    Attributes:
+        columns (tuple): The columns to read, by name. Empty reads every column.
+        trailing_columns (int): Also read this many columns from the end of the sheet,
+            whatever they are called (the requirements table shows the last two).
+        dtypes (tuple): (column, dtype) pairs passed on to pandas.read_excel.
+        categories (tuple): Columns read as text and stored as pandas categoricals, such
+            as the name columns, whose few distinct values repeat on many rows.
+    """
+    columns: tuple = ()
+    trailing_columns: int = 0
+    dtypes: tuple = ()
+    categories: tuple = ()
+
+
+NAME_COLUMNS = ("Last Name", "First Name")
+CLIENTS_SCHEMA = ExcelSchema(columns=NAME_COLUMNS, categories=NAME_COLUMNS)
+REQUIREMENTS_SCHEMA = ExcelSchema(
+    columns=NAME_COLUMNS, trailing_columns=2, categories=NAME_COLUMNS)
+GENERAL_ITEMS_SCHEMA = ExcelSchema(columns=NAME_COLUMNS + ("General Items",),
+                                   dtypes=(("General Items", "str"),), categories=NAME_COLUMNS)
+# The At a Glance table shows the whole sheet
+AT_A_GLANCE_SCHEMA = ExcelSchema()
+
+# python-calamine (a Rust reader) is several times faster than openpyxl, but optional
+EXCEL_ENGINE = "calamine" if importlib.util.find_spec(
+    "python_calamine") is not None else "openpyxl"
+
+# Parsed sheets are cached as Parquet files in the folder SEF_EXCEL_CACHE names, e.g.
+# ~/.cache/sef/excel. Off unless it is set, since the sheets hold client names
+EXCEL_CACHE_DIR = os.environ.get("SEF_EXCEL_CACHE", "")
+EXCEL_CACHE_ENTRIES = 64
+# Bump when the way sheets are read changes, so older cache entries are not used
+EXCEL_CACHE_VERSION = 1
+
+
+def read_excel_schema(data, schema, engine=None):
+    """
+    Reads the columns of a schema from the first sheet of an Excel file.
+
+    Args:
+        data (bytes): The contents of the Excel file.
+        schema (ExcelSchema): The columns to read and their types.
+        engine (str, optional): The pandas Excel engine. Defaults to EXCEL_ENGINE.
+
+    Returns:
+        pandas.DataFrame: The sheet's columns, in sheet order.
+    """
+    engine = engine or EXCEL_ENGINE
+    dtype = dict(schema.dtypes)
+    for column in schema.categories:
+        dtype.setdefault(column, "str")
+    usecols = None
+    if schema.trailing_columns:
+        header = list(pd.read_excel(io.BytesIO(data), nrows=0,
+                                    engine=engine).columns)
+        trailing = len(header) - schema.trailing_columns
+        usecols = [i for i, column in enumerate(header)
+                   if column in schema.columns or i >= trailing]
+    elif schema.columns:
+        # A callable, so that a column the sheet lacks is skipped rather than an error
+        def usecols(column):
+            return column in schema.columns
+    df = pd.read_excel(io.BytesIO(data), usecols=usecols, dtype=dtype or None,
+                       engine=engine)
+    for column in schema.categories:
+        if column in df.columns:
+            df[column] = df[column].astype("category")
+    return df
+
+
+def excel_cache_path(data, schema, engine=None):
+    """
+    Args:
+        data (bytes): The contents of an Excel file.
+        schema (ExcelSchema): The columns read from it.
+        engine (str, optional): The pandas Excel engine. Defaults to EXCEL_ENGINE.
+
+    Returns:
+        str: The path of its Parquet cache file, named after the workbook's hash.
+    """
+    settings = f"{EXCEL_CACHE_VERSION}|{engine or EXCEL_ENGINE}|{schema!r}"
+    return os.path.join(EXCEL_CACHE_DIR, "{}-{}.parquet".format(
+        hashlib.sha1(data).hexdigest(), hashlib.sha1(settings.encode("utf-8")).hexdigest()[:16]))
+
+
+def prune_excel_cache(max_entries=EXCEL_CACHE_ENTRIES):
+    """
+    Removes all but the most recently used Parquet cache files.
+    """
+    try:
+        paths = [os.path.join(EXCEL_CACHE_DIR, name) for name in os.listdir(EXCEL_CACHE_DIR)
+                 if name.endswith(".parquet")]
+        paths.sort(key=os.path.getmtime, reverse=True)
+        for path in paths[max_entries:]:
+            os.remove(path)
+    except OSError as error:
+        logger.debug("Could not prune the Excel cache: %s", error)
+
+
+def read_excel_cached(data, schema=AT_A_GLANCE_SCHEMA):
+    """
+    Reads an Excel file through the on-disk Parquet cache, if EXCEL_CACHE_DIR is set,
+    so a workbook that was already read by an earlier run loads in milliseconds.
+
+    Sheets that Parquet cannot hold (e.g. a column mixing numbers and text) are read
+    from the workbook every time.
+
+    Args:
+        data (bytes): The contents of the Excel file.
+        schema (ExcelSchema, optional): The columns to read. Defaults to every column.
+
+    Returns:
+        pandas.DataFrame: The sheet, see read_excel_schema.
+    """
+    if not EXCEL_CACHE_DIR:
+        return read_excel_schema(data, schema)
+    path = excel_cache_path(data, schema)
+    try:
+        df = pd.read_parquet(path, engine="pyarrow")
+        os.utime(path)
+        return df
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as error:
+        logger.warning("Ignoring the unreadable Excel cache file %s: %s", path, error)
+
+    df = read_excel_schema(data, schema)
+    buffer = io.BytesIO()
+    try:
+        df.to_parquet(buffer, engine="pyarrow", index=False)
+    except (ValueError, TypeError, NotImplementedError) as error:
+        logger.debug("Not caching a sheet Parquet cannot hold: %s", error)
+        return df
+    try:
+        write_file_atomically(path, buffer.getvalue())
+        prune_excel_cache()
+    except OSError as error:
+        logger.warning("Could not write the Excel cache file %s: %s", path, error)
+    # Hand back what later runs will read from the cache, so every run sees the same values
+    return pd.read_parquet(io.BytesIO(buffer.getvalue()), engine="pyarrow")
+
+
+# ************ END EXCEL INGESTION ************ #
+
+
+# ************ START UPLOAD CACHE ************ #
+# Streamlit re-runs this whole script on every interaction, so parsed uploads are cached
+# by their contents, shared across reruns and sessions and evicted least recently used.
+# Changing one upload only re-parses that file.
+
+UPLOAD_CACHE_ENTRIES = 16
+
+
+def streamlit_running():
+    """
+    Returns:
+        bool: Whether this process is running the Streamlit app. Streamlit is only looked
+        at if something (i.e. the app) has already imported it. Worker processes forked
+        from the app inherit its runtime, so they are ruled out explicitly.
+    """
+    if "streamlit" not in sys.modules:
+        return False
+    import multiprocessing
+    if multiprocessing.parent_process() is not None:
+        return False
+    from streamlit import runtime
+    return runtime.exists()
+
+
+def upload_cache(shared=False, max_entries=UPLOAD_CACHE_ENTRIES):
+    """
+    Caches a function of uploaded file contents, keyed by a hash of its arguments.
+
+    Inside the Streamlit app this is st.cache_data, or st.cache_resource for shared
+    objects, so entries survive reruns and are shared between sessions. Everywhere else,
+    including the app's worker processes (see streamlit_running), an LRU dict in the
+    process takes their place.
+
+    Args:
+        shared (bool, optional): Return the cached object itself rather than a copy. It must then never be modified. Defaults to False.
+        max_entries (int, optional): The number of entries kept. Defaults to UPLOAD_CACHE_ENTRIES.
+    """
+    def decorator(func):
+        # The Streamlit cache is only created once the app calls the function
+        streamlit_cached = []
+        entries = collections.OrderedDict()
+
+        @functools.wraps(func)
+        def cached(*args):
+            if streamlit_running():
+                if not streamlit_cached:
+                    import streamlit as st
+                    streamlit_cached.append((st.cache_resource if shared else st.cache_data)(
+                        max_entries=max_entries, show_spinner=False)(func))
+                return streamlit_cached[0](*args)
+            key = tuple(hashlib.sha1(arg).hexdigest() if isinstance(
+                arg, bytes) else arg for arg in args)
+            if key in entries:
+                entries.move_to_end(key)
+            else:
+                entries[key] = func(*args)
+                while len(entries) > max_entries:
+                    entries.popitem(last=False)
+            return entries[key] if shared else deepcopy(entries[key])
+        return cached
+    return decorator
+
+
+@upload_cache()
+def parse_excel_upload(data, schema=AT_A_GLANCE_SCHEMA):
+    """
+    Parses the first sheet of an Excel file.
+
+    Args:
+        data (bytes): The contents of the Excel file.
+        schema (ExcelSchema, optional): The columns to read. Defaults to every column.
+
+    Returns:
+        pandas.DataFrame: The sheet. Each call gets its own copy.
+    """
+    return read_excel_cached(data, schema)
+
+
+def read_excel_input(source, schema=AT_A_GLANCE_SCHEMA):
+    """
+    Reads an Excel input through the upload cache.
+
+    Args:
+        source (str or file-like): A file path or an open file such as a Streamlit UploadedFile.
+        schema (ExcelSchema, optional): The columns to read. Defaults to every column.
+
+    Returns:
+        pandas.DataFrame: The first sheet.
+    """
+    return parse_excel_upload(read_input_bytes(source), schema)
+
+
+@upload_cache(shared=True)
+def parse_client_row_index_upload(data, schema):
+    """
+    Parses a requirements or general items Excel file and indexes its rows by client.
+
+    Args:
+        data (bytes): The contents of the Excel file.
+        schema (ExcelSchema): The columns to read, e.g. REQUIREMENTS_SCHEMA.
+
+    Returns:
+        ClientRowIndex: The index. It is shared, so it must not be modified.
+    """
+    return ClientRowIndex(parse_excel_upload(data, schema))
+
+
+def load_client_row_index(source, schema):
+    """
+    Reads a requirements or general items Excel input through the upload cache.
+
+    Args:
+        source (str or file-like): A file path or an open file such as a Streamlit UploadedFile.
+        schema (ExcelSchema): The columns to read, e.g. REQUIREMENTS_SCHEMA.
+
+    Returns:
+        ClientRowIndex: The index. It is shared, so it must not be modified.
+    """
+    return parse_client_row_index_upload(read_input_bytes(source), schema)
+
+
+@upload_cache(shared=True)
+def parse_document_upload(data):
+    """
+    Parses a Word document and takes its whole body as a SectionFragment.
+
+    Args:
+        data (bytes): The contents of the Word document.
+
+    Returns:
+        SectionFragment: The document's body. It is shared, so it must not be modified.
+    """
+    doc = Document(io.BytesIO(data))
+    return SectionFragment([element for element in doc.element.body if element.tag != qn('w:sectPr')],
+                           doc.part)
+
+
+@upload_cache(shared=True)
+def render_image_story(data, story):
+    """
+    Decodes a header or footer image and renders it as a fragment.
+
+    Args:
+        data (bytes): The contents of the image.
+        story (str): 'header' or 'footer'.
+
+    Returns:
+        SectionFragment: The header or footer. It is shared, so it must not be modified.
+    """
+    if story == "header":
+        return SectionFragment.render(lambda session: session.add_image_to_header(io.BytesIO(data)), story="header")
+    return SectionFragment.render(lambda session: session.add_image_to_footer(io.BytesIO(data)), story="footer")
+
+
+# The box the header and footer images are shown in, in inches
+REPORT_IMAGE_SIZE = (7.83, 1.06)
+# The resolution images are resampled to for that box
+REPORT_IMAGE_DPI = 200
+
+
+@upload_cache()
+def prepare_report_image(data, width, height, dpi=REPORT_IMAGE_DPI):
+    """
+    Decodes an image once and shrinks it to what the box it is shown in needs.
+
+    The image is resampled to the box's size at dpi (never enlarged) and re-encoded as
+    PNG, or as JPEG when the image has no transparency and that is smaller. The original
+    is kept if it is already smaller than the result.
+
+    Args:
+        data (bytes): The contents of the image.
+        width (float): The width of the box in inches.
+        height (float): The height of the box in inches.
+        dpi (int, optional): The target resolution. Defaults to REPORT_IMAGE_DPI.
+
+    Returns:
+        bytes: The prepared image.
+    """
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    size = (min(image.width, round(width * dpi)),
+            min(image.height, round(height * dpi)))
+    if image.mode not in ("RGB", "RGBA", "L", "LA"):
+        image = image.convert(
+            "RGBA" if "transparency" in image.info or image.mode == "PA" else "RGB")
+    if image.size != size:
+        image = image.resize(size, Image.LANCZOS)
+
+    candidates = []
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", optimize=True, dpi=(dpi, dpi))
+    candidates.append(buffer.getvalue())
+    if image.mode in ("RGB", "L") or (image.mode in ("RGBA", "LA") and image.getextrema()[-1][0] == 255):
+        buffer = io.BytesIO()
+        image.convert("RGB" if image.mode != "L" else "L").save(
+            buffer, format="JPEG", quality=90, optimize=True, dpi=(dpi, dpi))
+        candidates.append(buffer.getvalue())
+    return min(candidates + [data], key=len)
+
+
+# ************ END UPLOAD CACHE ************ #
+
+
+# ************ DATA EXTRACTION FROM PANDAS DATAFRAMES FUNCTIONS ************ #
+def normalize_name_column(names):
+    """
+    Normalizes a column of names so they can be compared as lookup keys.
+
+    Blank cells become '', and every name is stripped and lowercased. A categorical
+    column only has its distinct names normalized.
+
+    Args:
+        names (pandas.Series): The 'First Name' or 'Last Name' column.
+
+    Returns:
+        pandas.Series: The normalized names.
+    """
+    if isinstance(names.dtype, pd.CategoricalDtype):
+        # Code -1 (a blank cell) picks the '' appended at the end
+        normalized = np.append(normalize_name_column(
+            pd.Series(names.cat.categories)).to_numpy(dtype=object), '')
+        return pd.Series(normalized[names.cat.codes.to_numpy()], index=names.index, name=names.name)
+    return names.fillna('').astype(str).str.strip().str.lower()
+
+
+def shared_rows_mask(last_names, first_names):
+    """
+    Finds the rows that apply to every client, i.e. rows named 'All' / 'All',
+    'All' / blank or blank / 'All'.
+
+    Args:
+        last_names (pandas.Series): The normalized last names.
+        first_names (pandas.Series): The normalized first names.
+
+    Returns:
+        pandas.Series: A boolean mask of the shared rows.
+    """
+    return ((first_names == 'all') & (last_names == 'all')) | \
+        ((first_names == 'all') & (last_names == '')) | \
+        ((first_names == '') & (last_names == 'all'))
+
+
+def extract_rows_by_name(df, last_name, first_name):
+    """
+    Extracts rows from a DataFrame based on last name and first name.
+
+    Parameters:
+    df (pandas.DataFrame): The DataFrame to extract rows from.
+    last_name (str): The last name to filter rows by.
+    first_name (str): The first name to filter rows by.
+
+    Returns:
+    pandas.DataFrame: The filtered DataFrame.
+    """
+    last_names = normalize_name_column(df['Last Name'])
+    first_names = normalize_name_column(df['First Name'])
+    # Adjust the condition to include rows with specific names or rows where both names are 'all'
+    mask = ((first_names == str(first_name).strip().lower()) & (last_names == str(last_name).strip().lower())) | \
+        shared_rows_mask(last_names, first_names)
+
+    return df[mask]
+
+
+class ClientRowIndex:
+    """
+    Groups a requirements or general items sheet by client in a single pass.
+
+    The names are normalized once and each client's row positions are kept in a
+    dict keyed by (last, first), while the rows that apply to every client are kept
+    as a separate shared block. Looking up one client's rows is then a dict lookup
+    instead of a scan of the whole sheet with extract_rows_by_name.
+
+    Args:
+        df (pandas.DataFrame): The sheet, with 'First Name' and 'Last Name' columns.
+    """
+
+    def __init__(self, df):
+        self.df = df
+        last_names = normalize_name_column(df['Last Name'])
+        first_names = normalize_name_column(df['First Name'])
+        self.shared_positions = np.flatnonzero(
+            shared_rows_mask(last_names, first_names).to_numpy())
+        self.positions = df.groupby(
+            [last_names.to_numpy(), first_names.to_numpy()], sort=False).indices
+
+    def shared_rows(self):
+        """
+        Returns:
+            pandas.DataFrame: The rows that apply to every client.
+        """
+        return self.df.iloc[self.shared_positions]
+
+    def rows_for(self, last_name, first_name):
+        """
+        Returns a client's own rows together with the shared rows, in sheet order.
+        This is the same selection as extract_rows_by_name.
+
+        Args:
+            last_name (str): The client's last name.
+            first_name (str): The client's first name.
+
+        Returns:
+            pandas.DataFrame: The client's rows.
+        """
+        key = (str(last_name).strip().lower(), str(first_name).strip().lower())
+        client_positions = self.positions.get(key)
+        if client_positions is None:
+            return self.shared_rows()
+        return self.df.iloc[np.union1d(client_positions, self.shared_positions)]
+
+
+SPREADSHEET_CACHE_SIZE = 8
+_spreadsheet_readers = {}
+
+
+class SpreadsheetReader:
+    """
+    The active sheet of a workbook, read once in read-only mode, with an index from each
+    header name to its column.
+
+    Attributes:
+        rows (list): The values of every row of the sheet, as tuples.
+        columns (dict): The column index of each name in the header (the first non-empty
+            row). Where a name appears more than once, the leftmost column wins.
+    """
+
+    def __init__(self, source):
+        """
+        Args:
+            source (str or file-like): The path of the workbook, or an open file.
+        """
+        if not isinstance(source, (str, os.PathLike)):
+            source = io.BytesIO(read_input_bytes(source))
+        wb = openpyxl.load_workbook(source, read_only=True)
+        try:
+            self.rows = list(wb.active.iter_rows(values_only=True))
+        finally:
+            wb.close()
+        self.columns = {}
+        header = next((row for row in self.rows if any(
+            value is not None for value in row)), ())
+        for j, value in enumerate(header):
+            if value is not None:
+                self.columns.setdefault(value, j)
+
+    @classmethod
+    def open(cls, source):
+        """
+        Returns the cached reader for a workbook, reading it only if it is new or changed.
+
+        Paths are cached by their modification time and size, open files by a hash of
+        their contents.
+
+        Args:
+            source (str or file-like): The path of the workbook, or an open file.
+
+        Returns:
+            SpreadsheetReader: The reader.
+        """
+        if isinstance(source, (str, os.PathLike)):
+            stat = os.stat(source)
+            key = (os.path.abspath(source), stat.st_mtime_ns, stat.st_size)
+        else:
+            key = hashlib.sha1(read_input_bytes(source)).hexdigest()
+        reader = _spreadsheet_readers.pop(key, None)
+        if reader is None:
+            reader = cls(source)
+        # Re-inserting keeps the most recently used workbooks at the end
+        _spreadsheet_readers[key] = reader
+        while len(_spreadsheet_readers) > SPREADSHEET_CACHE_SIZE:
+            del _spreadsheet_readers[next(iter(_spreadsheet_readers))]
+        return reader
+
+    def column_index(self, column_name):
+        """
+        Args:
+            column_name (str): The header of the column.
+
+        Returns:
+            int: The 0-based index of the column.
+
+        Raises:
+            ValueError: If the column name is not found in the spreadsheet.
+        """
+        try:
+            return self.columns[column_name]
+        except KeyError:
+            raise ValueError(f"{column_name} not found in the spreadsheet")
+
+    def cell(self, row_number, column_name):
+        """
+        Args:
+            row_number (int): The 0-based row number, counting the header row.
+            column_name (str): The header of the column.
+
+        Returns:
+            The contents of the cell, or None if it is empty.
+        """
+        column_index = self.column_index(column_name)
+        if row_number >= len(self.rows) or column_index >= len(self.rows[row_number]):
+            return None
+        return self.rows[row_number][column_index]
+
+    def row(self, row_number):
+        """
+        Args:
+            row_number (int): The 0-based row number, counting the header row.
+
+        Returns:
+            dict: The contents of each header's cell in the row.
+        """
+        values = self.rows[row_number] if row_number < len(self.rows) else ()
+        return {column_name: values[j] if j < len(values) else None
+                for column_name, j in self.columns.items()}
+
+
+def get_cell_contents(spreadsheet_path: str, row_number: int, column_name: str) -> str:
+    """
+    Retrieves the contents of a cell in a spreadsheet.
+
+    The workbook is read once and cached (see SpreadsheetReader.open), so looking up
+    several cells of the same file does not parse it again.
+
+    Args:
+        spreadsheet_path (str): The path to the spreadsheet file.
+        row_number (int): The row number of the cell.
+        column_name (str): The name of the column containing the cell.
+
+    Returns:
+        str: The contents of the cell.
+
+    Raises:
+        ValueError: If the column name is not found in the spreadsheet.
+    """
+    return SpreadsheetReader.open(spreadsheet_path).cell(row_number, column_name)
+
+# ************ END DATA EXTRACTION FROM PANDAS DATAFRAMES FUNCTIONS ************ #
+
+
+# ************ START CLIENT ROW STORE ************ #
+
+
+# Bump when the layout of the store changes; older stores are then emptied and refilled
+CLIENT_ROW_STORE_VERSION = 2
+CLIENT_ROW_STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sheets (
+    sheet TEXT PRIMARY KEY,
+    columns TEXT NOT NULL,
+    dtypes TEXT NOT NULL,
+    workbook_hash TEXT,
+    generation INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS rows (
+    sheet TEXT NOT NULL,
+    row_key TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    last_name TEXT NOT NULL,
+    first_name TEXT NOT NULL,
+    shared INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    generation INTEGER NOT NULL,
+    PRIMARY KEY (sheet, row_key)
+);
+CREATE INDEX IF NOT EXISTS rows_by_client ON rows (sheet, last_name, first_name);
+CREATE INDEX IF NOT EXISTS rows_shared ON rows (sheet, shared);
+"""
+
+
+def client_row_store_path(outer_folder_name):
+    """
+    Args:
+        outer_folder_name (str): The folder the reports are saved in.
+
+    Returns:
+        str: The path of the folder's client row store, which sits next to the folder.
+    """
+    return os.path.normpath(outer_folder_name) + ".store.sqlite3"
+
+
+def json_cell(value):
+    """
+    Converts a cell to a value json.dumps can write. Missing values become None, dates
+    and times ISO text and anything else that is not a plain number or string its text.
+    StoredClientRows.query turns them back into the column's dtype.
+    """
+    if value is None or (isinstance(value, float) and math.isnan(value)) or value is pd.NaT:
+        return None
+    if isinstance(value, (np.integer, np.floating, np.bool_)):
+        return value.item()
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+class ClientRowStore:
+    """
+    A local SQLite database of the requirements and general items sheets, indexed by the
+    normalized (last, first) name, so each client's rows are looked up with an index
+    query and large sheets do not have to be held in memory.
+
+    Importing a sheet only applies what changed since the last import: every row has a
+    key (a hash of its values), new rows are inserted, rows that are still there keep
+    their stored copy and rows that are gone are deleted.
+
+    Args:
+        path (str): The path of the database file, see client_row_store_path. It is
+            created if it does not exist.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = None
+
+    def __getstate__(self):
+        # Connections cannot be sent to worker processes; each one opens its own
+        state = self.__dict__.copy()
+        state["_connection"] = None
+        return state
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(
+                self.path, check_same_thread=False)
+            # Lets worker processes read while another run imports
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            (version,) = self._connection.execute("PRAGMA user_version").fetchone()
+            if version != CLIENT_ROW_STORE_VERSION:
+                # The store only mirrors the workbooks, so an older one is simply refilled
+                self._connection.executescript(
+                    "DROP TABLE IF EXISTS rows; DROP TABLE IF EXISTS sheets;")
+                self._connection.execute(
+                    f"PRAGMA user_version = {CLIENT_ROW_STORE_VERSION}")
+            self._connection.executescript(CLIENT_ROW_STORE_SCHEMA)
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def import_sheet(self, sheet, df, workbook_hash=None):
+        """
+        Brings a sheet in the store up to date with a DataFrame.
+
+        Args:
+            sheet (str): The sheet's name in the store, e.g. "requirements".
+            df (pandas.DataFrame): The sheet, with 'First Name' and 'Last Name' columns.
+            workbook_hash (str, optional): A hash of the workbook df was read from, see
+                workbook_hash. Defaults to None.
+
+        Returns:
+            dict: How many rows were 'added', 'removed' and 'kept'.
+        """
+        connection = self.connection
+        stored = connection.execute(
+            "SELECT generation FROM sheets WHERE sheet = ?", (sheet,)).fetchone()
+        generation = (stored[0] if stored is not None else 0) + 1
+
+        last_names = normalize_name_column(df['Last Name']).tolist()
+        first_names = normalize_name_column(df['First Name']).tolist()
+        shared = shared_rows_mask(pd.Series(last_names), pd.Series(first_names)).tolist()
+        rows = []
+        occurrences = collections.Counter()
+        for position, values in enumerate(df.itertuples(index=False, name=None)):
+            data = json.dumps([json_cell(value) for value in values])
+            # Identical rows get the same hash, so number their repeats
+            occurrences[data] += 1
+            row_key = hashlib.sha1(
+                f"{occurrences[data]}|{data}".encode("utf-8")).hexdigest()
+            rows.append((sheet, row_key, position, last_names[position], first_names[position],
+                         int(shared[position]), data, generation))
+
+        existing = {row_key for (row_key,) in connection.execute(
+            "SELECT row_key FROM rows WHERE sheet = ?", (sheet,))}
+        keys = {row[1] for row in rows}
+        with connection:
+            connection.execute(
+                "INSERT INTO sheets (sheet, columns, dtypes, workbook_hash, generation) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (sheet) DO UPDATE SET columns = excluded.columns, dtypes = excluded.dtypes, "
+                "workbook_hash = excluded.workbook_hash, generation = excluded.generation",
+                (sheet, json.dumps([json_cell(column) for column in df.columns]),
+                 json.dumps([str(dtype) for dtype in df.dtypes]), workbook_hash, generation))
+            connection.executemany(
+                "INSERT INTO rows (sheet, row_key, position, last_name, first_name, shared, data, generation) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (sheet, row_key) DO UPDATE SET position = excluded.position, "
+                "generation = excluded.generation", rows)
+            connection.execute(
+                "DELETE FROM rows WHERE sheet = ? AND generation <> ?", (sheet, generation))
+        return {"added": len(keys - existing), "removed": len(existing - keys), "kept": len(keys & existing)}
+
+    def workbook_hash(self, sheet):
+        """
+        Args:
+            sheet (str): The sheet's name in the store.
+
+        Returns:
+            str: The workbook hash given to the sheet's last import, or None.
+        """
+        stored = self.connection.execute(
+            "SELECT workbook_hash FROM sheets WHERE sheet = ?", (sheet,)).fetchone()
+        return stored[0] if stored is not None else None
+
+    def rows(self, sheet):
+        """
+        Args:
+            sheet (str): The sheet's name in the store.
+
+        Returns:
+            StoredClientRows: The sheet's rows, looked up like a ClientRowIndex.
+        """
+        return StoredClientRows(self, sheet)
+
+
+class StoredClientRows:
+    """
+    One sheet of a ClientRowStore, with the same lookups as ClientRowIndex.
+
+    Args:
+        store (ClientRowStore): The store.
+        sheet (str): The sheet's name in the store.
+    """
+
+    def __init__(self, store, sheet):
+        self.store = store
+        self.sheet = sheet
+        self._columns = None
+        self._dtypes = None
+        self._shared_rows = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_shared_rows"] = None
+        return state
+
+    @property
+    def columns(self):
+        if self._columns is None:
+            stored = self.store.connection.execute(
+                "SELECT columns, dtypes FROM sheets WHERE sheet = ?", (self.sheet,)).fetchone()
+            if stored is None:
+                raise KeyError(f"The store has no '{self.sheet}' sheet")
+            self._columns = json.loads(stored[0])
+            self._dtypes = json.loads(stored[1])
+        return self._columns
+
+    @property
+    def dtypes(self):
+        """
+        list: The dtype of each column in the imported sheet, as text.
+        """
+        if self._dtypes is None:
+            self.columns
+        return self._dtypes
+
+    def query(self, *conditions):
+        """
+        Args:
+            *conditions (tuple): (SQL condition, parameters) pairs. Each one is a separate
+                indexed lookup, so they are not combined with OR.
+
+        Returns:
+            pandas.DataFrame: The sheet's rows that match any of the conditions, in sheet order.
+        """
+        sql = " UNION ".join(f"SELECT position, data FROM rows WHERE sheet = ? AND {where}"
+                             for where, _ in conditions)
+        parameters = [parameter for _, condition_parameters in conditions
+                      for parameter in (self.sheet, *condition_parameters)]
+        found = self.store.connection.execute(
+            sql + " ORDER BY position", parameters).fetchall()
+        df = pd.DataFrame([json.loads(data) for _, data in found], columns=self.columns,
+                          index=[position for position, _ in found])
+        # Give the columns their types back, so the rows are formatted like the sheet's.
+        # Names stay plain strings: a categorical of just these rows would not match anyway
+        for j, dtype in enumerate(self.dtypes):
+            if dtype not in ("object", "category"):
+                df.isetitem(j, df.iloc[:, j].astype(dtype))
+        return df
+
+    def shared_rows(self):
+        """
+        Returns:
+            pandas.DataFrame: The rows that apply to every client.
+        """
+        if self._shared_rows is None:
+            self._shared_rows = self.query(("shared = 1", ()))
+        return self._shared_rows
+
+    def rows_for(self, last_name, first_name):
+        """
+        Returns a client's own rows together with the shared rows, in sheet order.
+        See ClientRowIndex.rows_for.
+
+        Args:
+            last_name (str): The client's last name.
+            first_name (str): The client's first name.
+
+        Returns:
+            pandas.DataFrame: The client's rows.
+        """
+        return self.query(("shared = 1", ()),
+                          ("last_name = ? AND first_name = ?", (str(last_name).strip().lower(), str(first_name).strip().lower())))
+
+
+def load_stored_client_rows(store, sheet, source, schema):
+    """
+    Imports a requirements or general items Excel input into a ClientRowStore, if it
+    changed since the last import, and returns the sheet's rows.
+
+    Args:
+        store (ClientRowStore): The store.
+        sheet (str): The sheet's name in the store, e.g. "requirements".
+        source (str or file-like): A file path or an open file such as a Streamlit UploadedFile.
+        schema (ExcelSchema): The columns to read, e.g. REQUIREMENTS_SCHEMA.
+
+    Returns:
+        StoredClientRows: The sheet's rows.
+    """
+    data = read_input_bytes(source)
+    workbook_hash = hashlib.sha1(
+        f"{schema!r}".encode("utf-8") + data).hexdigest()
+    if store.workbook_hash(sheet) != workbook_hash:
+        changes = store.import_sheet(
+            sheet, parse_excel_upload(data, schema), workbook_hash)
+        logger.debug("Imported the %s sheet into %s: %s",
+                     sheet, store.path, changes)
+    return store.rows(sheet)
+
+
+# ************ END CLIENT ROW STORE ************ #
+
+
+# ************ START PARAGRAPH INSERTION FUNCTIONS ************ #
+
+
+@dataclass
+class ReportStyle:
+    """
+    A named paragraph or character style that is defined once in each report's styles.xml
+    and referenced by every paragraph or run that uses it, instead of repeating the same
+    direct formatting on each run.
+
+    Attributes:
+        name (str): The style name shown in Word.
+        font_size (int): The font size in points.
+        font_name (str): The font, e.g. 'Calibri'.
+        font_color (str): The hex color of the text.
+        bold (bool): Whether the text is bold.
+        highlight (str): "Blue", "Yellow", "Green" or "Red" to highlight the text.
+        style_type (docx.enum.style.WD_STYLE_TYPE): PARAGRAPH or CHARACTER.
+    """
+    name: str
+    font_size: int = None
+    font_name: str = None
+    font_color: str = None
+    bold: bool = None
+    highlight: str = None
+    style_type: WD_STYLE_TYPE = WD_STYLE_TYPE.PARAGRAPH
+
+
+HIGHLIGHT_COLORS = {
+    "Blue": docx.enum.text.WD_COLOR_INDEX.BLUE,
+    "Yellow": docx.enum.text.WD_COLOR_INDEX.YELLOW,
+    "Green": docx.enum.text.WD_COLOR_INDEX.GREEN,
+    "Red": docx.enum.text.WD_COLOR_INDEX.RED,
+}
+
+# The styles used across the report. Restyle the report by changing them here.
+REPORT_STYLES = {style.name: style for style in (
+    ReportStyle("Report Title", 22, 'Calibri', "FFFFFF", bold=True, highlight="Blue"),
+    ReportStyle("Section Heading", 18, 'Calibri', "4C61BB", bold=True),
+    ReportStyle("Table Heading", 16, 'Calibri', "000000", bold=True),
+    ReportStyle("Warning Banner", 30, 'Calibri', "FFFFFF", highlight="Red"),
+    ReportStyle("Spacer", 1, 'Calibri', "000000"),
+)}
+
+
+def report_style_for(font_size=None, font_style=None, font_color=None, bold=None, highlight=None, style_type=WD_STYLE_TYPE.PARAGRAPH):
+    """
+    Finds the named report style with the given formatting, or makes one named after the
+    formatting if there is none, so ad hoc formatting still ends up as a style.
+    REPORT_STYLES itself is never changed.
+
+    Args:
+        font_size (int, optional): The font size in points.
+        font_style (str, optional): The font.
+        font_color (str, optional): The hex color of the text.
+        bold (bool, optional): Whether the text is bold.
+        highlight (str, optional): The highlight color name.
+        style_type (docx.enum.style.WD_STYLE_TYPE, optional): PARAGRAPH or CHARACTER.
+
+    Returns:
+        ReportStyle: The matching style.
+    """
+    for style in REPORT_STYLES.values():
+        if (style.font_size, style.font_name, style.font_color, style.bold, style.highlight, style.style_type) == \
+                (font_size, font_style, font_color, bold, highlight, style_type):
+            return style
+    parts = ["Report Text" if style_type == WD_STYLE_TYPE.PARAGRAPH else "Report Run"]
+    parts += [str(value) for value in (f"{font_size}pt" if font_size is not None else None,
+                                       font_style, font_color, "Bold" if bold else None, highlight) if value]
+    return ReportStyle(" ".join(parts), font_size, font_style,
+                       font_color, bold, highlight, style_type)
+
+
+def add_report_style(doc, report_style):
+    """
+    Defines a ReportStyle in a document's styles.xml, unless it is already there.
+
+    Args:
+        doc (docx.document.Document): The document.
+        report_style (ReportStyle): The style to define.
+
+    Returns:
+        docx.styles.style.BaseStyle: The style in the document.
+    """
+    try:
+        return doc.styles[report_style.name]
+    except KeyError:
+        pass
+    style = doc.styles.add_style(report_style.name, report_style.style_type)
+    if report_style.style_type == WD_STYLE_TYPE.PARAGRAPH:
+        style.base_style = doc.styles['Normal']
+    font = style.font
+    if report_style.font_size is not None:
+        font.size = docx.shared.Pt(report_style.font_size)
+    if report_style.font_name is not None:
+        font.name = report_style.font_name
+    if report_style.font_color is not None:
+        font.color.rgb = docx.shared.RGBColor.from_string(
+            report_style.font_color)
+    if report_style.bold is not None:
+        font.bold = report_style.bold
+    if report_style.highlight in HIGHLIGHT_COLORS:
+        font.highlight_color = HIGHLIGHT_COLORS[report_style.highlight]
+    return style
+
+
+def insert_paragraph_with_font_style(file_path, text, font_size, font_style, font_color, header=False, highlight=False):
+    """
+    Inserts a paragraph with specified font style into a Word document.
+
+    The formatting is defined once as a named style in the document (see
+    report_style_for) and the paragraph references it.
+
+    Args:
+        file_path (str): The file path of the Word document.
+        text (str): The text to be inserted as a paragraph.
+        font_size (int): The font size of the paragraph.
+        font_style (str): The font style of the paragraph.
+        font_color (tuple): The RGB color values of the font in the format (R, G, B).
+        header (bool, optional): Specifies whether the paragraph should be formatted as a header. Defaults to False.
+        highlight (str, optional): Specifies the highlight color of the font. Can be "Blue", "Yellow", "Green", or "Red". Defaults to False.
+
+    Returns:
+        None
+    """
+    with ReportSession(file_path) as session:
+        session.insert_paragraph_with_font_style(
+            text, font_size, font_style, font_color, header=header, highlight=highlight)
+
+
+def copy_text_with_design_from_word_doc(source_file, destination_file):
+    """
+    Copy text with design from a Word document to another Word document.
+
+    The source body is copied at the XML level, so tables, images, lists and every
+    run property come across unchanged.
+
+    Args:
+        source_file (str): The path of the source Word document.
+        destination_file (str): The path of the destination Word document.
+
+    Returns:
+        None
+    """
+    with ReportSession(destination_file) as session:
+        session.copy_text_with_design_from_word_doc(source_file)
+
+
+def create_bulleted_list(word_file_path, items: list, start_index=None, font_size=None, font_color=None, font_style=None):
+    """
+    Create a bulleted list in a Word document.
+
+    Args:
+        word_file_path (str): The file path of the Word document.
+        items (list): The list of items to be added as bullet points.
+        start_index (int, optional): The index at which to start applying the bullet style. Defaults to None.
+        font_size (int, optional): The font size of the bullet points. Defaults to None.
+        font_color (str, optional): The font color of the bullet points. Defaults to None.
+        font_style (str, optional): The font style of the bullet points. Defaults to None.
+    """
+    with ReportSession(word_file_path) as session:
+        session.create_bulleted_list(
+            items, start_index=start_index, font_size=font_size, font_color=font_color, font_style=font_style)
+
+
+def create_numbered_list(client_file_path, general_items_list):
+    """
+    Creates a Word document with a numbered list from a given Python list.
+
+    Args:
+    general_items_list (list): A list of strings to be added to the Word document as a numbered list.
+    client_file_path (str): The name of the Word file to be created.
+    """
+    with ReportSession(client_file_path) as session:
+        session.create_numbered_list(general_items_list)
+
+
+# ************ END PARAGRAPH INSERTION FUNCTIONS ************ #
+
+
+# ************ START TABLE INSERTION FUNCTIONS ************ #
+
+
+@dataclass
+class CellStyle:
+    """
+    Formatting for a table cell. Attributes left as None are not changed.
+
+    Attributes:
+        fill (str): The hex color of the cell shading, e.g. "F0F0F0".
+        font_color (str): The hex color of the cell's text, e.g. "FFFFFF".
+        bold (bool): Whether the cell's text is bold.
+    """
+    fill: str = None
+    font_color: str = None
+    bold: bool = None
+
+    def merged_with(self, override):
+        """
+        Returns:
+            CellStyle: This style with every attribute that override sets replaced.
+        """
+        return CellStyle(
+            fill=override.fill if override.fill is not None else self.fill,
+            font_color=override.font_color if override.font_color is not None else self.font_color,
+            bold=override.bold if override.bold is not None else self.bold)
+
+
+@dataclass
+class TableStyle:
+    """
+    A declarative description of how a report table is formatted, applied in a single
+    pass by apply_table_style or written straight into a new table by table_element_from_df.
+
+    Attributes:
+        header_fill (str): The hex color of the header row shading.
+        header_font_color (str): The hex color of the header row text.
+        header_bold (bool): Whether the header row text is bold.
+        band_fill (str): The hex color used to shade every other data row (rows 2, 4, ...).
+        cell_overrides (dict): CellStyles keyed by (row, column), applied on top of the rest.
+    """
+    header_fill: str = None
+    header_font_color: str = None
+    header_bold: bool = None
+    band_fill: str = None
+    cell_overrides: dict = field(default_factory=dict)
+
+    def cell_style(self, row, column):
+        """
+        Works out the formatting of one cell.
+
+        Args:
+            row (int): The row index, where 0 is the header.
+            column (int): The column index.
+
+        Returns:
+            CellStyle: The cell's formatting.
+        """
+        if row == 0:
+            style = CellStyle(fill=self.header_fill,
+                              font_color=self.header_font_color, bold=self.header_bold)
+        elif row % 2 == 0:
+            style = CellStyle(fill=self.band_fill)
+        else:
+            style = CellStyle()
+        override = self.cell_overrides.get((row, column))
+        if override is not None:
+            style = style.merged_with(override)
+        return style
+
+
+# The look shared by the requirements and At-a-Glance tables
+REPORT_TABLE_STYLE = TableStyle(header_fill="4C61BB", header_font_color="FFFFFF",
+                                header_bold=True, band_fill="F0F0F0")
+
+
+def normalize_hex_color(color_code):
+    """
+    Args:
+        color_code (str): A hex color such as "#4C61BB" or "4c61bb".
+
+    Returns:
+        str: The color without a leading '#', in upper case, as Word expects it.
+    """
+    return color_code.lstrip('#').upper()
+
+
+def set_cell_shading(tc, fill):
+    """
+    Sets the shading of a table cell, replacing any shading it already has.
+
+    Args:
+        tc (docx.oxml.table.CT_Tc): The cell element.
+        fill (str): The hex color of the shading.
+    """
+    table_cell_properties = tc.get_or_add_tcPr()
+    for shading in table_cell_properties.findall(qn("w:shd")):
+        table_cell_properties.remove(shading)
+    shading = OxmlElement("w:shd")
+    shading.set(qn("w:val"), "clear")
+    shading.set(qn("w:color"), "auto")
+    shading.set(qn("w:fill"), normalize_hex_color(fill))
+    table_cell_properties.insert_element_before(
+        shading, "w:noWrap", "w:tcMar", "w:textDirection", "w:tcFitText", "w:vAlign", "w:hideMark",
+        "w:headers", "w:cellIns", "w:cellDel", "w:cellMerge", "w:tcPrChange")
+
+
+def apply_table_style(table, table_style):
+    """
+    Applies a TableStyle to an existing table in one traversal of its cells.
+
+    Shading replaces whatever the cell already had, and the font settings are applied
+    to every run in the cell, so empty cells and multi-run cells are handled too.
+
+    Args:
+        table (docx.table.Table): The table to format.
+        table_style (TableStyle): The formatting to apply.
+    """
+    for row, tr in enumerate(table._tbl.tr_lst):
+        for column, tc in enumerate(tr.tc_lst):
+            style = table_style.cell_style(row, column)
+            if style.fill is not None:
+                set_cell_shading(tc, style.fill)
+            if style.font_color is None and style.bold is None:
+                continue
+            for r in tc.iter(qn('w:r')):
+                font = Font(r)
+                if style.bold is not None:
+                    font.bold = style.bold
+                if style.font_color is not None:
+                    font.color.rgb = docx.shared.RGBColor.from_string(
+                        normalize_hex_color(style.font_color))
+
+
+def bold_first_row(file_path, table_number):
+    """
+    Bold the first row of a table in a Word document.
+
+    Args:
+        file_path (str): The path to the Word document.
+        table_number (int): The index of the table in the document.
+
+    Returns:
+        None
+    """
+    with ReportSession(file_path) as session:
+        session.bold_first_row(table_number)
+
+
+def make_bold(file_path, row, column, table_number):
+    """
+    Makes the text in a specific cell of a table bold in a Word document.
+
+    Args:
+        file_path (str): The path of the Word document.
+        row (int): The row index of the cell.
+        column (int): The column index of the cell.
+        table_number (int): The index of the table in the document.
+
+    Returns:
+        None
+    """
+    with ReportSession(file_path) as session:
+        session.make_bold(row, column, table_number)
+
+
+def color_alternate_rows(file_path, color_code, table_number):
+    """
+    Color alternate rows of a table in a Word document.
+
+    Args:
+        file_path (str): The file path of the Word document.
+        color_code (str): The color code to apply to the alternate rows.
+        table_number (int): The index of the table in the document.
+
+    Returns:
+        None
+    """
+    with ReportSession(file_path) as session:
+        session.color_alternate_rows(color_code, table_number)
+
+
+def color_header(file_path, color_code, table_number):
+    """
+    Color the header cells of a table in a Word document.
+
+    Args:
+        file_path (str): The path to the Word document.
+        color_code (str): The color code to apply to the header cells.
+        table_number (int): The index of the table in the document.
+
+    Returns:
+        None
+    """
+    with ReportSession(file_path) as session:
+        session.color_header(color_code, table_number)
+
+
+@dataclass
+class ColumnFormat:
+    """
+    How the values of one DataFrame column are written into a report table.
+
+    Attributes:
+        kind (str): "text" to use the values as they are, "number" for numbers or "percent"
+            for numbers followed by a percentage sign. Values are taken to already be in
+            percentage points, so 5 is written as "5%".
+        decimals (int): The number of decimal places for numbers and percentages. None
+            keeps the value as it is.
+        thousands (bool): Whether to group thousands with commas.
+        na_rep (str): The text written for missing values.
+    """
+    kind: str = "text"
+    decimals: int = None
+    thousands: bool = False
+    na_rep: str = ""
+
+    def number_format(self):
+        """
+        Returns:
+            str: The format string for the numeric values of the column.
+        """
+        spec = "," if self.thousands else ""
+        if self.decimals is not None:
+            spec += f".{self.decimals}f"
+        return "{:" + spec + "}" + ("%" if self.kind == "percent" else "")
+
+
+TEXT_FORMAT = ColumnFormat()
+PERCENT_FORMAT = ColumnFormat("percent")
+
+
+def format_column(column, column_format):
+    """
+    Converts a column to display strings according to its format.
+
+    Numeric formats only apply to values that are numbers; any other text in the column
+    is kept as it is. Dates and times are written as str() of each value, e.g.
+    "2021-01-02 00:00:00". Missing values, including NaT, are always written as
+    column_format.na_rep.
+
+    Args:
+        column (pandas.Series): The column to format.
+        column_format (ColumnFormat): The format of the column.
+
+    Returns:
+        pandas.Series: The column as strings.
+    """
+    if column.dtype.kind in "mM":
+        # Series.astype(str) drops midnight times, unlike str() of each value
+        text = column.astype(object).astype(str)
+    else:
+        text = column.astype(str)
+    if column_format.kind != "text":
+        numbers = pd.to_numeric(column, errors="coerce")
+        is_number = numbers.notna().to_numpy()
+        if is_number.any():
+            text[is_number] = numbers[is_number].map(
+                column_format.number_format().format)
+    text[column.isna().to_numpy()] = column_format.na_rep
+    return text
+
+
+def format_dataframe(df, column_formats=None, default=TEXT_FORMAT):
+    """
+    Converts a whole DataFrame to display strings, one column at a time.
+
+    Args:
+        df (pandas.DataFrame): The DataFrame to format.
+        column_formats (dict, optional): ColumnFormat for each column name. Defaults to None.
+        default (ColumnFormat, optional): The format of the columns not in column_formats.
+            Defaults to TEXT_FORMAT.
+
+    Returns:
+        pandas.DataFrame: A new DataFrame of strings with the same index and columns.
+    """
+    if column_formats is None:
+        column_formats = {}
+    formatted = pd.DataFrame(index=df.index)
+    for j in range(df.shape[1]):
+        formatted[j] = format_column(
+            df.iloc[:, j], column_formats.get(df.columns[j], default)).to_numpy()
+    formatted.columns = df.columns
+    return formatted
+
+
+def add_percent_to_pandas_df(df):
+    """
+    Adds a percentage sign (%) to each value in a pandas DataFrame.
+
+    Args:
+        df (pandas.DataFrame): The DataFrame to modify.
+
+    Returns:
+        pandas.DataFrame: A new DataFrame with percentage signs added to each numeric value.
+    """
+    return format_dataframe(df, default=PERCENT_FORMAT)
+
+
+def highlight_first_row(file_path, rgb_color, table_number):
+    """
+    Color alternate rows of a table in a Word document.
+
+    Args:
+        file_path (str): The file path of the Word document.
+        color_code (str): The color code to apply to the alternate rows.
+        table_number (int): The index of the table in the document.
+
+    Returns:
+        None
+    """
+    with ReportSession(file_path) as session:
+        session.highlight_first_row(rgb_color, table_number)
+
+
+def make_first_row_bold(file_path, table_number):
+    """
+    Makes the first row of a table in a Word document bold.
+
+    Args:
+        file_path (str): The path to the Word document.
+        table_number (int): The index of the table in the document.
+
+    Returns:
+        None
+    """
+    with ReportSession(file_path) as session:
+        session.make_first_row_bold(table_number)
+
+
+def run_content_xml(text):
+    """
+    Builds the content of a w:r element for a piece of text, the same way python-docx
+    does when a run's text is set: tabs become w:tab and line breaks become w:br.
+
+    Args:
+        text (str): The text of the run.
+
+    Returns:
+        str: The XML for the run's children.
+    """
+    pieces = []
+    for piece in re.split(r'(\t|\r\n|\n|\r)', text):
+        if piece == '\t':
+            pieces.append('<w:tab/>')
+        elif piece in ('\n', '\r', '\r\n'):
+            pieces.append('<w:br/>')
+        elif piece:
+            space = ' xml:space="preserve"' if piece != piece.strip() else ''
+            pieces.append(f'<w:t{space}>{html_escape(piece, quote=False)}</w:t>')
+    return ''.join(pieces)
+
+
+def table_element_from_df(df, width, style_id, table_style=None, column_formats=None):
+    """
+    Builds a complete w:tbl element for a DataFrame in a single pass.
+
+    The whole table, with the column names as its first row, is written out as one
+    XML string and parsed once, with the shading and fonts from table_style already in
+    place. This avoids python-docx's cell lookups, which walk the grid on every call, so
+    the cost grows linearly with the number of rows.
+
+    Args:
+        df (pandas.DataFrame): The DataFrame containing the data for the table.
+        width (docx.shared.Length): The width available to the table, split evenly between the columns.
+        style_id (str): The id of the table style, e.g. 'TableGrid'.
+        table_style (TableStyle, optional): The header, banding and cell formatting. Defaults to None.
+        column_formats (dict, optional): ColumnFormat for each column name, see
+            format_dataframe. Defaults to None, which writes the values as they are.
+
+    Returns:
+        docx.oxml.table.CT_Tbl: The table element.
+    """
+    if table_style is None:
+        table_style = TableStyle()
+    columns = df.shape[1]
+    column_width = docx.shared.Emu(width // columns).twips if columns else 0
+    values = format_dataframe(df, column_formats).to_numpy()
+
+    def cell_xml(text, style):
+        shading = f'<w:shd w:val="clear" w:color="auto" w:fill="{normalize_hex_color(style.fill)}"/>' \
+            if style.fill else ''
+        run_properties = ''
+        if style.bold is not None:
+            run_properties += '<w:b/>' if style.bold else '<w:b w:val="0"/>'
+        if style.font_color is not None:
+            run_properties += f'<w:color w:val="{normalize_hex_color(style.font_color)}"/>'
+        if run_properties:
+            run_properties = f'<w:rPr>{run_properties}</w:rPr>'
+        return (f'<w:tc><w:tcPr><w:tcW w:w="{column_width}" w:type="dxa"/>{shading}</w:tcPr>'
+                f'<w:p><w:r>{run_properties}{run_content_xml(text)}</w:r></w:p></w:tc>')
+
+    def row_xml(row, texts):
+        cells = ''.join(cell_xml(text, table_style.cell_style(row, column))
+                        for column, text in enumerate(texts))
+        return f'<w:tr>{cells}</w:tr>'
+
+    rows = [row_xml(0, [str(column) for column in df.columns])]
+    for i in range(len(values)):
+        rows.append(row_xml(i + 1, values[i]))
+
+    grid = ''.join(
+        f'<w:gridCol w:w="{column_width}"/>' for _ in range(columns))
+    return parse_xml(
+        f'<w:tbl {nsdecls("w")}>'
+        f'<w:tblPr><w:tblStyle w:val="{style_id}"/><w:tblW w:type="auto" w:w="0"/>'
+        '<w:tblLook w:firstColumn="1" w:firstRow="1" w:lastColumn="0" w:lastRow="0" w:noHBand="0" w:noVBand="1" w:val="04A0"/>'
+        f'</w:tblPr><w:tblGrid>{grid}</w:tblGrid>{"".join(rows)}</w:tbl>')
+
+
+def create_table(df, file_path, shade_color):
+    """
+    Create a table in a Word document using the provided DataFrame.
+
+    The table is built in one pass with table_element_from_df, with its header and
+    every other row shaded and the 'Table Grid' style applied.
+
+    Args:
+        df (pandas.DataFrame): The DataFrame containing the data for the table.
+        file_path (str): The file path of the Word document.
+        shade_color (str): The color used to shade alternate rows.
+
+    Returns:
+        None
+    """
+    with ReportSession(file_path, new=not check_file_exists(file_path)) as session:
+        session.create_table(df, shade_color)
+
+# ************ END TABLE INSERTION FUNCTIONS ************ #
+
+
+# ************ START PAGE BREAK ************ #
+
+
+def insert_page_break(client_file_paths_list):
+    """
+    Inserts a page break at the end of each document in the given list of client file paths.
+
+    Args:
+        client_file_paths_list (list): A list of file paths representing the client documents.
+
+    Returns:
+        None
+    """
+    for i in range(len(client_file_paths_list)):
+        with ReportSession(client_file_paths_list[i]) as session:
+            session.insert_page_break()
+
+# ************ END PAGE BREAK ************ #
+
+
+# ************ START MARGIN MANIPULATION ************ #
+
+
+def change_margins(client_file_paths_list, top, bottom, left, right):
+    """
+    Change the margins of the documents in the given list of file paths.
+
+    Args:
+        client_file_paths_list (list): List of file paths of the documents.
+        top (float): Top margin value in inches.
+        bottom (float): Bottom margin value in inches.
+        left (float): Left margin value in inches.
+        right (float): Right margin value in inches.
+    """
+    for i in range(len(client_file_paths_list)):
+        with ReportSession(client_file_paths_list[i]) as session:
+            session.change_margins(top, bottom, left, right)
+
+
+def change_header_margins(client_file_paths_list, top, bottom, left, right):
+    """
+    Change the header margins of the specified Word documents.
+
+    Args:
+        client_file_paths_list (list): List of file paths of the Word documents.
+        top (float): The top margin value to set.
+        bottom (float): The bottom margin value to set.
+        left (float): The left margin value to set.
+        right (float): The right margin value to set.
+    """
+    for i in range(len(client_file_paths_list)):
+        with ReportSession(client_file_paths_list[i]) as session:
+            session.change_header_margins(top, bottom, left, right)
+
+
+# ************ END MARGIN MANIPULATION ************ #
+
+
+# ************ END HELPER FUNCTIONS ************ #
+
+
+# ************ START FILE PATH CREATION ************ #
+
+
+def generate_file_path(outer_folder_name, windows_file_path="Windows", file=None, row=None, first_name=None, last_name=None, year=None, quarter=None):
+    '''    
+    Generate the file path for the 401(K) preliminary report.
+
+    Args:
+        file (str): The file path.
+        row (int): The row number.
+        first_name (str): The first name.
+        last_name (str): The last name.
+        year (int): The year.
+        quarter (int): The quarter.
+
+    Returns:
+        str: The file path for the 401(K) preliminary report.
+    '''
+    if not first_name or not last_name:
+        reader = SpreadsheetReader.open(file)
+        first_name = first_name or reader.cell(row, "First Name")
+        last_name = last_name or reader.cell(row, "Last Name")
+        logger.debug("Client %s %s, %s Q%s", first_name,
+                     last_name, year, quarter)
+
+    if windows_file_path == "Windows":
+        return f'{outer_folder_name}\\{last_name}, {first_name}\\{year} Q{quarter} {last_name}, {first_name} - 401(K) Preliminary Report.docx'
+    else:
+        return f'{outer_folder_name}/{last_name}, {first_name}/{year} Q{quarter} {last_name}, {first_name} - 401(K) Preliminary Report.docx'
+
+
+def create_client_list(outer_folder_name, windows_file_path="Windows", client_excel_file=None, quarter=None, year=None):
+    """
+    Iterates over each row of an excel file and creates a list of file paths for each client.
+
+    Args:
+        clients_excel (str): The path to the Excel file.
+        quarter (str): The quarter of the report.
+        year (int): The year of the report.
+
+    Returns:
+        tuple: A tuple containing the list of client report names and the list of client names.
+    """
+    df = read_excel_input(client_excel_file, CLIENTS_SCHEMA)
+
+    # Drop repeated clients by their normalized names, keeping the first spelling
+    names = df[['Last Name', 'First Name']]
+    keys = pd.DataFrame({'last': normalize_name_column(df['Last Name']),
+                        'first': normalize_name_column(df['First Name'])})
+    unique_names = names[~keys.duplicated()]
+
+    # Sort the set of names
+    unique_names = unique_names.sort_values(
+        ['Last Name', 'First Name'], kind='stable')
+    sorted_client_names = list(zip(
+        unique_names['Last Name'].tolist(), unique_names['First Name'].tolist()))
+
+    # Generate file paths for each sorted name
+    clients_report_names = [generate_file_path(
+        outer_folder_name=outer_folder_name, windows_file_path=windows_file_path, first_name=first_name, last_name=last_name, year=year, quarter=quarter)
+        for last_name, first_name in sorted_client_names]
+
+    return clients_report_names, [[last_name, first_name] for last_name, first_name in sorted_client_names]
+
+
+# ************ END FILE PATH CREATION ************ #
+
+
+# ************ START FILE MANAGEMENT AND DELETION ************ #
+
+
+def delete_and_replace_old_files(clients_files_list):
+    """
+    Deletes existing files in the given list of file paths and replaces them with new blank documents.
+
+    Args:
+        clients_files_list (list): A list of file paths.
+
+    Returns:
+        None
+    """
+    for file_path in clients_files_list:
+        logger.debug("Replacing %s", file_path)
+        # Extract the directory from the file path
+        directory = os.path.dirname(file_path)
+
+        # Check if the directory exists, if not, create it
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        # Check if the file exists
+        if os.path.exists(file_path):
+            # If it does, remove it
+            os.remove(file_path)
+
+        # Create a new blank document
+        doc = new_document()
+        # Save the blank document with the intended file path
+        doc.save(file_path)
+
+
+# ************ END FILE MANAGEMENT AND DELETION ************ #
+
+
+# ************ BLANK LINE INSERTION ************ #
+def add_blank_line(client_file_paths_list):
+    """
+    Adds a blank line to each document in the given list of client file paths.
+
+    Args:
+        client_file_paths_list (list): A list of file paths for client documents.
+
+    Returns:
+        None
+    """
+    for i in range(len(client_file_paths_list)):
+        with ReportSession(client_file_paths_list[i]) as session:
+            session.add_blank_line()
+
+
+# ************ START TITLE INSERTION ************ #
+
+
+def insert_401k_titles(clients_files_list):
+    """
+    Inserts titles for 401k reports into the specified client files.
+
+    Args:
+        clients_files_list (list): A list of file paths for the client files.
+
+    Returns:
+        None
+    """
+    for i in range(len(clients_files_list)):
+        with ReportSession(clients_files_list[i]) as session:
+            session.insert_401k_title()
+
+
+# ************ END TITLE INSERTION ************ #
+
+
+# ************ START IN BRIEF INSERTION ************ #
+
+
+def add_in_brief(in_brief_file, client_files):
+    """
+    Add in brief information from a Word document to multiple client files.
+
+    Parameters:
+    - in_brief_file (str): The path of the Word document containing the in brief information.
+    - client_files (list): A list of paths to the client files.
+
+    Returns:
+    None
+    """
+    for i in range(len(client_files)):
+        with ReportSession(client_files[i]) as session:
+            session.add_in_brief(in_brief_file)
+
+
+# ************ END IN BRIEF INSERTION ************ #
+
+
+# ************ START REQUIREMENTS INSERTION ************ #
+
+
+def add_relevent_points_of_interest_title(client_file_paths_list):
+    for i in range(len(client_file_paths_list)):
+        with ReportSession(client_file_paths_list[i]) as session:
+            session.add_relevent_points_of_interest_title()
+
+
+def requirements_df_to_word(df, word_file, row_color, year, quarter, header_color=None):
+    """
+    Convert a DataFrame to a Word document with specific formatting.
+
+    Parameters:
+    - df (pandas.DataFrame): The DataFrame to be converted.
+    - word_file (str): The path to the Word document file.
+    - row_color (tuple): The RGB color code for the table rows.
+    - header_color (tuple, optional): The RGB color code for the table header. Defaults to None.
+
+    Returns:
+    None
+    """
+    with ReportSession(word_file) as session:
+        session.requirements_df_to_word(
+            df, row_color, year, quarter, header_color)
+
+
+def add_requirements_table(client_file_paths_list, client_names_list, requirements_excel_file, row_color, year, quarter, header_color=None):
+    """
+    Adds a requirements table to each client file.
+
+    Parameters:
+    - client_file_paths_list (list): A list of file paths for each client file.
+    - client_names_list (list): A list of client names, where each element is a tuple containing the first and last name.
+    - requirements_excel_file (str): The file path of the requirements Excel file.
+    - row_color (str): The color of the rows in the table.
+    - header_color (str, optional): The color of the table header. Defaults to None.
+
+    Returns:
+    None
+    """
+    requirements_index = load_client_row_index(
+        requirements_excel_file, REQUIREMENTS_SCHEMA)
+    for i in range(len(client_file_paths_list)):
+        with ReportSession(client_file_paths_list[i]) as session:
+            session.add_requirements_table(
+                client_names_list[i], requirements_index, row_color, year, quarter, header_color)
+
+
+# ************ END REQUIREMENTS INSERTION ************ #
+
+
+# ************ START GENERAL ITEMS INSERTION ************ #
+
+
+def insert_general_items_bulleted_list(client_file_paths_list, general_items_file_path, client_names_list, font_size=None, font_color=None, font_style=None):
+    """
+    Inserts a bulleted list of general items into each client file.
+
+    Parameters:
+    - client_file_paths_list (list): A list of file paths for each client file.
+    - general_items_file_path (str): The file path of the general items file.
+    - client_names_list (list): A list of client names.
+    - font_size (int, optional): The font size of the bulleted list. Defaults to None.
+    - font_color (str, optional): The font color of the bulleted list. Defaults to None.
+    - font_style (str, optional): The font style of the bulleted list. Defaults to None.
+    """
+    general_items_index = load_client_row_index(
+        general_items_file_path, GENERAL_ITEMS_SCHEMA)
+    logger.debug("General items from %s", general_items_file_path)
+
+    for i in range(len(client_file_paths_list)):
+        with ReportSession(client_file_paths_list[i]) as session:
+            session.insert_general_items_bulleted_list(
+                client_names_list[i], general_items_index, font_size=font_size, font_color=font_color, font_style=font_style)
+
+
+# ************ END GENERAL ITEMS INSERTION ************ #
+
+
+# ************ START AT A GLANCE INSERTION ************ #
+
+
+def create_at_a_glance_table(at_a_glance_df, word_file_path, shade_color):
+    """
+    Creates an "at a glance" table in a Word document.
+
+    Parameters:
+    at_a_glance_df (DataFrame): The DataFrame containing the data for the table.
+    word_file_path (str): The file path of the Word document.
+    shade_color (str): The color used to shade the table cells.
+
+    Returns:
+    None
+    """
+    with ReportSession(word_file_path) as session:
+        session.create_at_a_glance_table(at_a_glance_df, shade_color)
+
+
+def insert_at_a_glance(client_file_paths_list, at_a_glance_excel_file, at_a_glance_fine_print, quarter, year, shade_color):
+    """
+    Inserts an 'At a Glance' section into each client file.
+
+    Parameters:
+    - client_file_paths_list (list): List of file paths for each client file.
+    - at_a_glance_excel_file (str): File path of the Excel file containing the 'At a Glance' data.
+    - at_a_glance_fine_print (str): File path of the Word document containing the 'At a Glance' fine print.
+    - quarter (int): Quarter number.
+    - year (int): Year.
+    - shade_color (tuple): RGB color tuple for shading the table.
+
+    Returns:
+    None
+    """
+    at_a_glance_df = format_dataframe(
+        read_excel_input(at_a_glance_excel_file), default=PERCENT_FORMAT)
+    for i in range(len(client_file_paths_list)):
+        with ReportSession(client_file_paths_list[i]) as session:
+            session.insert_at_a_glance(
+                at_a_glance_df, at_a_glance_fine_print, quarter, year, shade_color)
+
+
+# ************ END AT A GLANCE INSERTION ************ #
+
+
+# ************ START HEADER AND FOOTER INSERTION ************ #
+
+
+def add_image_to_header(client_file_paths_list, image_path):
+    """
+    Adds an image to the header of each document in the client_file_paths_list.
+
+    Args:
+        client_file_paths_list (list): List of file paths of the client documents.
+        image_path (str): Path of the image to be added to the header.
+
+    Returns:
+        None
+    """
+    for i in range(len(client_file_paths_list)):
+        with ReportSession(client_file_paths_list[i]) as session:
+            session.add_image_to_header(image_path)
+
+
+def add_image_to_footer(client_file_paths_list, image_path):
+    """
+    Adds an image to the footer of each document in the given list of client file paths.
+
+    Args:
+        client_file_paths_list (list): A list of file paths to the client documents.
+        image_path (str): The file path of the image to be added to the footer.
+
+    Returns:
+        None
+    """
+    for i in range(len(client_file_paths_list)):
+        with ReportSession(client_file_paths_list[i]) as session:
+            session.add_image_to_footer(image_path)
+
+
+@dataclass
+class ReportInputs:
+    """
+    The inputs shared by every client's report, read once up front.
+
+    Uploaded documents and images are held as raw bytes so the whole bundle can be
+    pickled and sent to worker processes.
+
+    Attributes:
+        year (int): The year of the report.
+        quarter (int): The quarter of the report.
+        in_brief (bytes): The in-brief Word document.
+        requirements_index (ClientRowIndex or StoredClientRows): The requirements sheet, grouped by client.
+        general_items_index (ClientRowIndex or StoredClientRows): The general items sheet, grouped by client.
+        at_a_glance_df (pandas.DataFrame): The At-a-Glance data, already formatted with percent signs.
+        at_a_glance_fine_print (bytes): The At-a-Glance fine print Word document.
+        header_image (bytes): The header image.
+        footer_image (bytes): The footer image.
+    """
+    year: int
+    quarter: int
+    in_brief: bytes
+    requirements_index: ClientRowIndex
+    general_items_index: ClientRowIndex
+    at_a_glance_df: pd.DataFrame
+    at_a_glance_fine_print: bytes
+    header_image: bytes
+    footer_image: bytes
+
+
+class ReportGenerationError(Exception):
+    """
+    Raised when one or more client reports could not be built.
+
+    Attributes:
+        errors (list): One dict per failed report with its 'client', 'file_path', the 'stage'
+            that failed, the worker's 'pid' and the 'traceback'.
+        file_paths (list): The reports that were built successfully, in roster order.
+    """
+
+    def __init__(self, errors, file_paths):
+        self.errors = errors
+        self.file_paths = file_paths
+        summary = "; ".join(
+            f"{error['client']} ({error['stage']}): {error['traceback'].strip().splitlines()[-1]}" for error in errors)
+        super().__init__(
+            f"{len(errors)} report(s) could not be built: {summary}")
+
+
+class ReportGenerationCancelled(Exception):
+    """
+    Raised when a run is cancelled before every report was built.
+
+    Attributes:
+        file_paths (list): The reports that were built before it stopped, in roster order.
+        errors (list): The reports that had failed by then, as in ReportGenerationError.
+    """
+
+    def __init__(self, file_paths, errors=()):
+        self.file_paths = file_paths
+        self.errors = list(errors)
+        super().__init__(
+            f"Cancelled after {len(file_paths)} report(s) were built")
+
+
+def read_input_bytes(source):
+    """
+    Reads an input file into memory.
+
+    Args:
+        source (str or file-like): A file path or an open file such as a Streamlit UploadedFile.
+
+    Returns:
+        bytes: The contents of the file.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return f.read()
+    source.seek(0)
+    return source.read()
+
+
+def load_report_inputs(year, quarter, in_brief_file, requirements_file_path, general_items_file_path, at_a_glance_excel_file, at_a_glance_fine_print, header_image_path, footer_image_path, store=None):
+    """
+    Reads every shared input once so it can be reused for each client's report.
+
+    Args:
+        See main().
+
+    Returns:
+        ReportInputs: The parsed spreadsheets and raw documents and images.
+    """
+    if store is not None:
+        requirements_index = load_stored_client_rows(
+            store, "requirements", requirements_file_path, REQUIREMENTS_SCHEMA)
+        general_items_index = load_stored_client_rows(
+            store, "general_items", general_items_file_path, GENERAL_ITEMS_SCHEMA)
+    else:
+        requirements_index = load_client_row_index(
+            requirements_file_path, REQUIREMENTS_SCHEMA)
+        general_items_index = load_client_row_index(
+            general_items_file_path, GENERAL_ITEMS_SCHEMA)
+    return ReportInputs(
+        year=year,
+        quarter=quarter,
+        in_brief=read_input_bytes(in_brief_file),
+        requirements_index=requirements_index,
+        general_items_index=general_items_index,
+        at_a_glance_df=format_dataframe(
+            read_excel_input(at_a_glance_excel_file), default=PERCENT_FORMAT),
+        at_a_glance_fine_print=read_input_bytes(at_a_glance_fine_print),
+        header_image=read_input_bytes(header_image_path),
+        footer_image=read_input_bytes(footer_image_path),
+    )
+
+
+# Bump whenever a change to the code changes what the reports look like, so incremental
+# runs rebuild every report instead of reusing ones made with the old layout.
+LAYOUT_VERSION = 3
+
+
+def hash_rows(digest, df):
+    """
+    Adds a DataFrame's column names and values to a running hash.
+
+    Args:
+        digest (hashlib._Hash): The hash to update.
+        df (pandas.DataFrame): The rows.
+    """
+    digest.update(repr(list(df.columns)).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(
+        df.astype(str), index=False).to_numpy().tobytes())
+
+
+def client_input_hashes(client_file_paths_list, client_names, inputs):
+    """
+    Hashes everything each client's report is built from: the client's name and file
+    name, their requirement and general item rows (including the rows shared by all
+    clients), the shared documents and images, the year and quarter and LAYOUT_VERSION.
+
+    Args:
+        client_file_paths_list (list): The file paths of the client reports.
+        client_names (list): The [last name, first name] of each client.
+        inputs (ReportInputs): The inputs shared by every client's report.
+
+    Returns:
+        list: The hex digest of each client's inputs, in roster order.
+    """
+    shared = hashlib.sha1()
+    shared.update(
+        f"{LAYOUT_VERSION}|{inputs.year}|{inputs.quarter}".encode("utf-8"))
+    for data in (inputs.in_brief, inputs.at_a_glance_fine_print, inputs.header_image, inputs.footer_image):
+        shared.update(hashlib.sha1(data).digest())
+    hash_rows(shared, inputs.at_a_glance_df)
+
+    hashes = []
+    for i in range(len(client_file_paths_list)):
+        last_name, first_name = client_names[i]
+        digest = shared.copy()
+        digest.update(
+            f"|{ntpath.basename(client_file_paths_list[i])}|{last_name}|{first_name}".encode("utf-8"))
+        hash_rows(digest, inputs.requirements_index.rows_for(
+            last_name, first_name))
+        hash_rows(digest, inputs.general_items_index.rows_for(
+            last_name, first_name))
+        hashes.append(digest.hexdigest())
+    return hashes
+
+
+def report_manifest_path(outer_folder_name):
+    """
+    Args:
+        outer_folder_name (str): The folder the reports are saved in.
+
+    Returns:
+        str: The path of the folder's manifest, which sits next to the folder.
+    """
+    return os.path.normpath(outer_folder_name) + ".manifest.json"
+
+
+class ReportManifest:
+    """
+    Records the input hash of every report saved in an output folder, so an incremental
+    run only rebuilds the reports whose inputs changed and reuses the rest from disk.
+
+    Args:
+        path (str): The path of the manifest file.
+        reports (dict, optional): The input hash of each report, by file path. Defaults to None.
+
+    Attributes:
+        reused (list): The file paths of the reports reused in this run.
+    """
+
+    def __init__(self, path, reports=None):
+        self.path = path
+        self.reports = reports if reports is not None else {}
+        self.reused = []
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads a manifest, starting an empty one if there is none yet, it can't be read
+        or it was written for another LAYOUT_VERSION.
+
+        Args:
+            path (str): The path of the manifest file.
+
+        Returns:
+            ReportManifest: The manifest.
+        """
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cls(path)
+        if not isinstance(data, dict) or data.get("layout_version") != LAYOUT_VERSION:
+            return cls(path)
+        return cls(path, dict(data.get("reports", {})))
+
+    def is_current(self, file_path, digest):
+        """
+        Args:
+            file_path (str): The file path of a report.
+            digest (str): The hash of the report's current inputs.
+
+        Returns:
+            bool: Whether the report on disk was built from exactly these inputs.
+        """
+        return self.reports.get(file_path) == digest and os.path.isfile(file_path)
+
+    def record(self, file_path, digest):
+        """
+        Records that a report was saved from inputs with the given hash.
+        """
+        self.reports[file_path] = digest
+
+    def save(self):
+        """
+        Writes the manifest next to the output folder.
+        """
+        write_file_atomically(self.path, json.dumps(
+            {"layout_version": LAYOUT_VERSION, "reports": self.reports}, indent=1).encode("utf-8"))
+
+
+# The stages build_client_report goes through for every report, in order
+REPORT_STAGES = ("title", "in brief", "requirements", "general items",
+                 "margins", "at a glance", "header and footer", "save")
+
+
+def build_client_report(file_path, client_name, inputs, shared_sections=None, write_to_disk=True, metrics=None):
+    """
+    Builds one client's complete 401k report in memory and serializes it once.
+
+    Runs every section stage from main() in order against a single ReportSession,
+    so the document is only built and written a single time. Sections that are the
+    same for every client are copied in from shared_sections rather than rebuilt.
+
+    Args:
+        file_path (str): The file path of the client's report.
+        client_name (list): The client's [last name, first name].
+        inputs (ReportInputs): The inputs shared by every client's report.
+        shared_sections (SharedSections, optional): The pre-rendered shared sections. Rendered from inputs if not given.
+        write_to_disk (bool, optional): Also save the report to file_path. Defaults to True.
+        metrics (RunMetrics, optional): Times each stage. Defaults to None.
+
+    Returns:
+        bytes: The .docx file.
+
+    Raises:
+        ReportStageError: If a stage fails, naming the stage.
+    """
+    year = inputs.year
+    quarter = inputs.quarter
+    if metrics is None:
+        metrics = RunMetrics(enabled=False)
+    stage = "shared sections"
+    try:
+        if shared_sections is None:
+            metrics.enter(stage)
+            shared_sections = SharedSections(inputs)
+        stage = metrics.enter("title")
+        session = ReportSession(file_path, new=True)
+        session.insert_401k_title()
+        stage = metrics.enter("in brief")
+        session.insert_fragment(shared_sections.in_brief)
+        stage = metrics.enter("requirements")
+        session.add_requirements_table(
+            client_name, inputs.requirements_index, "F0F0F0", year, quarter)  # Check to see if this is the right color
+        stage = metrics.enter("general items")
+        session.insert_fragment(shared_sections.general_items_title)
+        session.add_general_items(client_name, inputs.general_items_index)
+        stage = metrics.enter("margins")
+        session.change_margins(docx.shared.Inches(
+            0.5), docx.shared.Inches(1.5), docx.shared.Inches(0.5), docx.shared.Inches(0.5))
+        session.change_header_margins(docx.shared.Inches(
+            0.1), docx.shared.Inches(0.1), docx.shared.Inches(0.1), docx.shared.Inches(0.1))
+        stage = metrics.enter("at a glance")
+        session.insert_fragment(shared_sections.at_a_glance)
+
+        stage = metrics.enter("header and footer")
+        session.insert_fragment(shared_sections.header)
+        session.insert_fragment(shared_sections.footer)
+
+        stage = metrics.enter("save")
+        data = session.to_bytes()
+        if write_to_disk:
+            write_file_atomically(file_path, data)
+    except Exception as error:
+        raise ReportStageError(stage, error) from error
+    finally:
+        metrics.leave()
+    return data
+
+
+class ReportStageError(Exception):
+    """
+    Raised by build_client_report when one of its stages fails.
+
+    Attributes:
+        stage (str): The stage that failed, e.g. "requirements".
+        error (Exception): The original error.
+    """
+
+    def __init__(self, stage, error):
+        self.stage = stage
+        self.error = error
+        super().__init__(f"{stage}: {type(error).__name__}: {error}")
+
+
+def write_file_atomically(file_path, data):
+    """
+    Writes a file so that it is either completely written or not changed at all, even if
+    the process is killed midway: the data goes to a temporary file in the same folder,
+    which then replaces the target in one step. The folder is created if needed.
+
+    Args:
+        file_path (str): The file path.
+        data (bytes): The contents.
+    """
+    directory = os.path.dirname(file_path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(
+        dir=directory or None, prefix=".~", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, file_path)
+        count_metric("bytes_written", len(data))
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def report_journal_path(outer_folder_name):
+    """
+    Args:
+        outer_folder_name (str): The folder the reports are saved in.
+
+    Returns:
+        str: The path of the folder's run journal, which sits next to the folder.
+    """
+    return os.path.normpath(outer_folder_name) + ".journal.jsonl"
+
+
+class RunJournal:
+    """
+    An append-only log of the reports finished in a run, written to disk as each one is
+    saved. If the run is interrupted, the next run with the same journal skips every report
+    that was already finished from the same inputs and resumes with the rest. The journal is
+    removed once a run completes without errors.
+
+    Args:
+        path (str): The path of the journal file.
+
+    Attributes:
+        reports (dict): The input hash of each finished report, by file path.
+        resumed (list): The file paths of the reports skipped in this run because an
+            interrupted run had already finished them.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.reports = {}
+        self.resumed = []
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+        except OSError:
+            lines = []
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # The last line may be cut short if the run was killed while writing it
+                continue
+            if entry.get("layout_version", LAYOUT_VERSION) != LAYOUT_VERSION:
+                self.reports = {}
+                break
+            if "file_path" in entry:
+                self.reports[entry["file_path"]] = entry["hash"]
+
+    def is_current(self, file_path, digest):
+        """
+        Args:
+            file_path (str): The file path of a report.
+            digest (str): The hash of the report's current inputs.
+
+        Returns:
+            bool: Whether an earlier run already finished this report from these inputs.
+        """
+        return self.reports.get(file_path) == digest and os.path.isfile(file_path)
+
+    def record(self, file_path, digest):
+        """
+        Appends a finished report to the journal and flushes it to disk.
+        """
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"layout_version": LAYOUT_VERSION,
+                    "file_path": file_path, "hash": digest}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.reports[file_path] = digest
+
+    def complete(self):
+        """
+        Removes the journal once every report of the run was built.
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+# How many reports each worker process may have finished or queued ahead of the one
+# being added to the archive. Bounds the serialized reports held in memory at once.
+REPORTS_IN_FLIGHT_PER_WORKER = 2
+
+
+def report_worker_context():
+    """
+    Forking a process that runs other threads (the Streamlit server, a ReportJob, the
+    archive's compression threads) can deadlock the child if a thread holds a lock at
+    that moment. Worker processes are therefore forked from a clean forkserver process
+    where the platform has one, and spawned otherwise.
+
+    Returns:
+        multiprocessing.context.BaseContext: The context to start worker processes with.
+    """
+    import multiprocessing
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+# The shared inputs and sections of a worker process, set up once by init_report_worker
+_worker_state = {}
+
+
+def build_report_result(file_path, client_name, inputs, shared_sections, write_to_disk, metrics=None):
+    """
+    Builds one client's report, catching any error so the other reports can carry on.
+
+    Args:
+        file_path (str): The file path of the client's report.
+        client_name (list): The client's [last name, first name].
+        inputs (ReportInputs): The inputs shared by every client's report.
+        shared_sections (dict): Holds the SharedSections under "sections", rendered on first use.
+        write_to_disk (bool): Also save the report to file_path.
+        metrics (RunMetrics, optional): Records the report's stages and wall time. Defaults to None.
+
+    Returns:
+        dict: The 'file_path', the worker's 'pid', the report's 'data', the 'metrics' of a
+        report built in a worker process and, if it failed, the 'stage' that failed and the
+        'traceback' of the error.
+    """
+    if metrics is None:
+        metrics = RunMetrics(enabled=False)
+    result = {"file_path": file_path, "pid": os.getpid(), "data": None,
+              "stage": None, "traceback": None, "metrics": None}
+    start = time.perf_counter()
+    with metrics.activate():
+        try:
+            if shared_sections.get("sections") is None:
+                try:
+                    with metrics.stage("shared sections"):
+                        shared_sections["sections"] = SharedSections(inputs)
+                except Exception as error:
+                    raise ReportStageError("shared sections", error) from error
+            result["data"] = build_client_report(file_path, client_name, inputs,
+                                                 shared_sections["sections"], write_to_disk=write_to_disk, metrics=metrics)
+        except ReportStageError as error:
+            result["stage"] = error.stage
+            result["traceback"] = "".join(
+                traceback.format_exception(error.error))
+        except Exception:
+            result["traceback"] = traceback.format_exc()
+    if metrics.enabled:
+        metrics.clients[file_path] = time.perf_counter() - start
+    return result
+
+
+def init_report_worker(inputs, metrics_options=None):
+    """
+    Runs once in each worker process, so the shared inputs are only sent to it once
+    and the shared sections are only rendered once per worker.
+
+    Args:
+        inputs (ReportInputs): The inputs shared by every client's report.
+        metrics_options (dict, optional): See RunMetrics.options. Defaults to None, which records nothing.
+    """
+    _worker_state["inputs"] = inputs
+    _worker_state["shared_sections"] = {}
+    _worker_state["metrics_options"] = metrics_options or {"enabled": False}
+
+
+def build_report_in_worker(file_path, client_name, write_to_disk):
+    """
+    Builds one client's report in a worker process set up by init_report_worker.
+
+    Returns:
+        dict: See build_report_result. Its 'metrics' hold what was recorded for this report.
+    """
+    metrics = RunMetrics(**_worker_state["metrics_options"])
+    result = build_report_result(file_path, client_name, _worker_state["inputs"],
+                                 _worker_state["shared_sections"], write_to_disk, metrics=metrics)
+    if metrics.enabled:
+        result["metrics"] = metrics
+    return result
+
+
+def iter_report_results(client_file_paths_list, client_names, inputs, workers=1, write_to_disk=True, metrics=None):
+    """
+    Builds every client's report, yielding each one in roster order as soon as it and
+    every report before it are done.
+
+    With several workers, each report is a separate task, but only
+    REPORTS_IN_FLIGHT_PER_WORKER tasks per worker are queued ahead of the report being
+    yielded, so finished reports never pile up in memory.
+
+    Args:
+        See generate_reports.
+
+    Yields:
+        dict: See build_report_result.
+    """
+    if workers <= 1 or len(client_file_paths_list) == 1:
+        shared_sections = {}
+        for i in range(len(client_file_paths_list)):
+            yield build_report_result(client_file_paths_list[i], client_names[i], inputs, shared_sections, write_to_disk, metrics=metrics)
+        return
+
+    def collect(file_path, future):
+        try:
+            return future.result()
+        except Exception:
+            # The worker itself died (e.g. killed or out of memory)
+            return {"file_path": file_path, "pid": None, "data": None, "stage": "worker",
+                    "traceback": traceback.format_exc(), "metrics": None}
+
+    metrics_options = metrics.options() if metrics is not None else None
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(client_file_paths_list)), mp_context=report_worker_context(),
+                                                initializer=init_report_worker, initargs=(inputs, metrics_options)) as executor:
+        pending = collections.deque()
+        try:
+            for i in range(len(client_file_paths_list)):
+                pending.append((client_file_paths_list[i], executor.submit(
+                    build_report_in_worker, client_file_paths_list[i], client_names[i], write_to_disk)))
+                if len(pending) >= workers * REPORTS_IN_FLIGHT_PER_WORKER:
+                    yield collect(*pending.popleft())
+            while pending:
+                yield collect(*pending.popleft())
+        except GeneratorExit:
+            # The caller stopped early (e.g. the run was cancelled): drop the queued reports
+            for _, future in pending:
+                future.cancel()
+            raise
+
+
+def generate_reports(client_file_paths_list, client_names, inputs, workers=1, archive=None, write_to_disk=True, manifest=None, journal=None, metrics=None, progress=None, cancel=None):
+    """
+    Builds every client's report, optionally across a pool of worker processes, and
+    streams each finished report into an archive and/or onto disk.
+
+    Reports are collected in roster order no matter which worker finishes first. A
+    report that fails does not stop the others.
+
+    Args:
+        client_file_paths_list (list): The file paths of the client reports.
+        client_names (list): The [last name, first name] of each client.
+        inputs (ReportInputs): The inputs shared by every client's report.
+        workers (int, optional): The number of worker processes. 1 builds every report in this process. Defaults to 1.
+            The workers re-import the main script (see report_worker_context), so a script
+            that uses several must guard its own work with `if __name__ == "__main__":`.
+        archive (ReportArchive, optional): Adds each finished report to this archive. Defaults to None.
+        write_to_disk (bool, optional): Save each report to its file path. Defaults to True.
+        manifest (ReportManifest, optional): Only rebuild the reports whose inputs changed since the
+            manifest was saved; the others are reused from disk. Needs write_to_disk. Defaults to None.
+        journal (RunJournal, optional): Record each report as soon as it is saved and skip the
+            reports an interrupted run with this journal already finished. Needs write_to_disk.
+            Defaults to None.
+        metrics (RunMetrics, optional): Records the time spent in each stage and on each
+            report, including those built in worker processes. Defaults to None.
+        progress (callable, optional): Called as progress(done, total, file_path) as each
+            report is finished, reused or fails. Defaults to None.
+        cancel (threading.Event, optional): Stops the run before the next report once it is
+            set. The reports already built are kept, and a resumable run picks up from there.
+            Defaults to None.
+
+    Returns:
+        list: The file paths of the reports, in roster order.
+
+    Raises:
+        ReportGenerationCancelled: If cancel was set before every report was built.
+        ReportGenerationError: If any report failed. The other reports are still written.
+        ValueError: If a manifest or journal is given without write_to_disk.
+    """
+    if (manifest is not None or journal is not None) and not write_to_disk:
+        raise ValueError(
+            "Incremental and resumable runs need the reports to be saved to disk")
+
+    if metrics is None:
+        metrics = RunMetrics(enabled=False)
+    if manifest is not None or journal is not None:
+        with metrics.stage("input hashes"):
+            hashes = client_input_hashes(
+                client_file_paths_list, client_names, inputs)
+        records = [record for record in (manifest, journal) if record is not None]
+        rebuild = [i for i in range(len(client_file_paths_list))
+                   if not any(record.is_current(client_file_paths_list[i], hashes[i]) for record in records)]
+    else:
+        rebuild = list(range(len(client_file_paths_list)))
+    rebuild_set = set(rebuild)
+    built = iter_report_results([client_file_paths_list[i] for i in rebuild], [
+                                client_names[i] for i in rebuild], inputs, workers=workers, write_to_disk=write_to_disk, metrics=metrics)
+
+    file_paths = []
+    errors = []
+    try:
+        for i in range(len(client_file_paths_list)):
+            if cancel is not None and cancel.is_set():
+                raise ReportGenerationCancelled(file_paths, errors)
+            if i in rebuild_set:
+                result = next(built)
+                if result["metrics"] is not None:
+                    metrics.merge(result["metrics"])
+            else:
+                # Unchanged since the last run: keep the report on disk as it is
+                with metrics.stage("reuse"):
+                    result = {"file_path": client_file_paths_list[i], "pid": None, "stage": None, "traceback": None,
+                              "data": read_input_bytes(client_file_paths_list[i]) if archive is not None else None}
+                if manifest is not None and manifest.is_current(result["file_path"], hashes[i]):
+                    manifest.reused.append(result["file_path"])
+                else:
+                    journal.resumed.append(result["file_path"])
+            if progress is not None:
+                progress(i + 1, len(client_file_paths_list),
+                         result["file_path"])
+            if result["traceback"] is not None:
+                last_name, first_name = client_names[i]
+                errors.append({"client": f"{last_name}, {first_name}", "file_path": result["file_path"],
+                               "stage": result["stage"], "pid": result["pid"], "traceback": result["traceback"]})
+                continue
+            if manifest is not None:
+                manifest.record(result["file_path"], hashes[i])
+            if journal is not None and i in rebuild_set:
+                journal.record(result["file_path"], hashes[i])
+            if archive is not None:
+                with metrics.stage("archive"):
+                    archive.add(result["file_path"], result["data"])
+            file_paths.append(result["file_path"])
+    finally:
+        # Shuts the worker pool down now if the run stopped early
+        built.close()
+        if manifest is not None:
+            manifest.save()
+    if errors:
+        raise ReportGenerationError(errors, file_paths)
+    if journal is not None:
+        journal.complete()
+    return file_paths
+
+
+def main(year, quarter, outer_folder_name, windows_file_path, clients_excel_file, in_brief_file, requirements_file_path, general_items_file_path, at_a_glance_excel_file, at_a_glance_fine_print, header_image_path, footer_image_path, workers=1, archive=None, write_to_disk=True, manifest=None, journal=None, metrics=None, store=None, progress=None, cancel=None):
+    """
+    Main function for creating 401k reports.
+
+    Args:
+        year (int): The year of the report.
+        quarter (int): The quarter of the report.
+        in_brief_file (str): The file path of the in-brief document.
+        requirements_file_path (str): The file path of the requirements document.
+        general_items_file_path (str): The file path of the general items document.
+        at_a_glance_excel_file (str): The file path of the At-a-Glance Excel file.
+        at_a_glance_fine_print (str): The fine print for the At-a-Glance section.
+        header_image_path (str): The file path of the header image.
+        footer_image_path (str): The file path of the footer image.
+        workers (int, optional): The number of worker processes to build reports with. Defaults to 1.
+        archive (ReportArchive, optional): Streams every finished report into this zip archive. Defaults to None.
+        write_to_disk (bool, optional): Save the reports under outer_folder_name. Defaults to True.
+        manifest (ReportManifest, optional): Only rebuild the reports whose inputs changed, see
+            report_manifest_path. Defaults to None, which rebuilds every report.
+        journal (RunJournal, optional): Make the run resumable if it is interrupted, see
+            report_journal_path. Defaults to None.
+        metrics (RunMetrics, optional): Records where the run spends its time. Defaults to None.
+        store (ClientRowStore, optional): Keep the requirements and general items in this
+            database and look each client's rows up there, see client_row_store_path.
+            Defaults to None, which holds them in memory.
+        progress (callable, optional): Called as each report is done, see generate_reports. Defaults to None.
+        cancel (threading.Event, optional): Stops the run once it is set, see generate_reports. Defaults to None.
+    """
+    if metrics is None:
+        metrics = RunMetrics(enabled=False)
+    with metrics.activate(), metrics.stage("run"):
+        with metrics.stage("client list"):
+            client_list = create_client_list(
+                outer_folder_name, windows_file_path, clients_excel_file, quarter, year)
+        client_file_paths_list = client_list[0]
+        client_names = client_list[1]
+        logger.debug("Building %d reports: %s",
+                     len(client_file_paths_list), client_file_paths_list)
+
+        with metrics.stage("load inputs"):
+            inputs = load_report_inputs(year, quarter, in_brief_file, requirements_file_path, general_items_file_path,
+                                        at_a_glance_excel_file, at_a_glance_fine_print, header_image_path, footer_image_path, store=store)
+
+        return generate_reports(client_file_paths_list, client_names, inputs, workers=workers, archive=archive, write_to_disk=write_to_disk, manifest=manifest, journal=journal, metrics=metrics, progress=progress, cancel=cancel)
+
+import zipfile
+
+# Archives larger than this are moved from memory to a temporary file
+ARCHIVE_SPOOL_SIZE = 64 * 1024 * 1024
+# zlib's default trade-off between speed and size; 0 stores the reports uncompressed
+ARCHIVE_COMPRESSION_LEVEL = 6
+# Sizes, offsets and entry counts past these need ZIP64 records
+ZIP64_LIMIT = (1 << 32) - 1
+ZIP_FILECOUNT_LIMIT = (1 << 16) - 1
+
+
+@dataclass
+class ArchiveEntry:
+    """
+    One compressed report, ready to be written into the archive.
+    """
+    name: bytes
+    crc: int
+    size: int
+    compressed: bytes
+    method: int
+    date_time: tuple
+    offset: int = 0
+    compressed_size: int = 0
+
+
+def compress_archive_entry(name, data, level, date_time):
+    """
+    Compresses one archive member. Runs on the archive's thread pool: zlib releases the
+    GIL while it works, so several members are compressed at once.
+
+    Args:
+        name (str): The member's file name in the archive.
+        data (bytes): The member's contents.
+        level (int): The zlib compression level, 0 to 9.
+        date_time (tuple): The member's (year, month, day, hour, minute, second).
+
+    Returns:
+        ArchiveEntry: The compressed member.
+    """
+    if level == 0:
+        compressed, method = data, zipfile.ZIP_STORED
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        compressed = compressor.compress(data) + compressor.flush()
+        method = zipfile.ZIP_DEFLATED
+    return ArchiveEntry(name.encode("utf-8"), zlib.crc32(data), len(data), compressed, method, date_time)
+
+
+class ReportArchive:
+    """
+    A zip archive that finished reports are streamed into as soon as they are serialized,
+    so the reports never have to be written to disk and read back.
+
+    Members are deflated in parallel on a thread pool and written one after another in
+    the order they were added. Only a few compressed members wait in memory at a time;
+    the archive itself is held in memory up to ARCHIVE_SPOOL_SIZE and in a temporary
+    file beyond that. ZIP64 records are written when the archive needs them.
+
+    Args:
+        fileobj (file-like, optional): Write the archive here instead, e.g. an open file. Defaults to None.
+        compresslevel (int, optional): The zlib compression level, 0 (store) to 9. Defaults to ARCHIVE_COMPRESSION_LEVEL.
+        threads (int, optional): The number of compression threads. Defaults to the number of CPUs.
+    """
+
+    def __init__(self, fileobj=None, compresslevel=ARCHIVE_COMPRESSION_LEVEL, threads=None):
+        if fileobj is None:
+            fileobj = tempfile.SpooledTemporaryFile(max_size=ARCHIVE_SPOOL_SIZE)
+        self.fileobj = fileobj
+        self.compresslevel = compresslevel
+        self.threads = threads or os.cpu_count() or 1
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.threads)
+        self.pending = collections.deque()
+        self.entries = []
+        self.offset = 0
+        self.closed = False
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def add(self, file_path, data):
+        """
+        Queues one report to be compressed into the archive.
+
+        Args:
+            file_path (str): The report's file path. Only its file name is kept.
+            data (bytes): The .docx file.
+        """
+        self.pending.append(self.executor.submit(
+            compress_archive_entry, ntpath.basename(file_path), data, self.compresslevel,
+            datetime.datetime.now().timetuple()[:6]))
+        self.count += 1
+        while len(self.pending) > 2 * self.threads:
+            self.write_entry(self.pending.popleft().result())
+
+    def write(self, data):
+        """
+        Appends raw bytes to the archive, keeping track of the offset without seeking.
+        """
+        self.fileobj.write(data)
+        self.offset += len(data)
+
+    def write_entry(self, entry):
+        """
+        Writes a compressed member's local header and data at the end of the archive.
+
+        Args:
+            entry (ArchiveEntry): The compressed member.
+        """
+        entry.offset = self.offset
+        zip64 = entry.size >= ZIP64_LIMIT or len(entry.compressed) >= ZIP64_LIMIT
+        extra = struct.pack("<HHQQ", 1, 16, entry.size,
+                            len(entry.compressed)) if zip64 else b""
+        self.write(struct.pack(
+            "<IHHHHHIIIHH", 0x04034b50, 45 if zip64 else 20, 0x800, entry.method,
+            *zip_dos_time(entry.date_time), entry.crc,
+            0xFFFFFFFF if zip64 else len(entry.compressed),
+            0xFFFFFFFF if zip64 else entry.size, len(entry.name), len(extra)))
+        self.write(entry.name)
+        self.write(extra)
+        self.write(entry.compressed)
+        # Only the header fields are needed for the central directory
+        entry.compressed_size = len(entry.compressed)
+        entry.compressed = None
+        self.entries.append(entry)
+
+    def close(self):
+        """
+        Writes the remaining members and the central directory.
+
+        Returns:
+            file-like: The archive, positioned at its start if it can seek.
+        """
+        if self.closed:
+            return self.fileobj
+        try:
+            while self.pending:
+                self.write_entry(self.pending.popleft().result())
+        finally:
+            self.executor.shutdown()
+        self.write_central_directory()
+        self.closed = True
+        if self.fileobj.seekable():
+            self.fileobj.seek(0)
+        return self.fileobj
+
+    def write_central_directory(self):
+        """
+        Writes the central directory and end records, with ZIP64 fields where needed.
+        """
+        directory_offset = self.offset
+        for entry in self.entries:
+            values = [(entry.size, entry.size >= ZIP64_LIMIT),
+                      (entry.compressed_size, entry.compressed_size >= ZIP64_LIMIT),
+                      (entry.offset, entry.offset >= ZIP64_LIMIT)]
+            zip64_values = [value for value, too_large in values if too_large]
+            extra = struct.pack(f"<HH{len(zip64_values)}Q", 1, 8 * len(zip64_values),
+                                *zip64_values) if zip64_values else b""
+            size, compressed_size, offset = (
+                0xFFFFFFFF if too_large else value for value, too_large in values)
+            version = 45 if zip64_values else 20
+            self.write(struct.pack(
+                "<IHHHHHHIIIHHHHHII", 0x02014b50, (3 << 8) | version, version, 0x800, entry.method,
+                *zip_dos_time(entry.date_time), entry.crc, compressed_size, size,
+                len(entry.name), len(extra), 0, 0, 0, 0o100644 << 16, offset))
+            self.write(entry.name)
+            self.write(extra)
+        directory_size = self.offset - directory_offset
+
+        count = len(self.entries)
+        if count >= ZIP_FILECOUNT_LIMIT or directory_offset >= ZIP64_LIMIT or directory_size >= ZIP64_LIMIT:
+            zip64_end_offset = self.offset
+            self.write(struct.pack("<IQHHIIQQQQ", 0x06064b50, 44, (3 << 8) | 45, 45, 0, 0,
+                                   count, count, directory_size, directory_offset))
+            self.write(struct.pack(
+                "<IIQI", 0x07064b50, 0, zip64_end_offset, 1))
+            count = 0xFFFF if count >= ZIP_FILECOUNT_LIMIT else count
+            directory_size = 0xFFFFFFFF if directory_size >= ZIP64_LIMIT else directory_size
+            directory_offset = 0xFFFFFFFF if directory_offset >= ZIP64_LIMIT else directory_offset
+        self.write(struct.pack("<IHHHHIIH", 0x06054b50, 0, 0, count, count,
+                               directory_size, directory_offset, 0))
+
+
+def zip_dos_time(date_time):
+    """
+    Args:
+        date_time (tuple): (year, month, day, hour, minute, second).
+
+    Returns:
+        tuple: The MS-DOS (time, date) fields of a zip header.
+    """
+    year, month, day, hour, minute, second = date_time
+    return (hour << 11) | (minute << 5) | (second // 2), (max(year, 1980) - 1980) << 9 | (month << 5) | day
+
+
+def create_zip_file(file_paths, zip_file_path):
+    """
+    Zips reports that are already on disk.
+
+    Args:
+        file_paths (list): The file paths of the reports.
+        zip_file_path (str): The file path of the zip file.
+    """
+    with open(zip_file_path, "wb") as f, ReportArchive(f) as archive:
+        for file in file_paths:
+            archive.add(file, read_input_bytes(file))
+            
+            
+# ************ START COMMAND LINE ************ #
+
+
+# The input files of a run, by their command line option / job file key
+CLI_INPUT_FILES = ("clients", "in_brief", "requirements", "general_items",
+                   "at_a_glance", "fine_print", "header_image", "footer_image")
+# Job file values that are paths, resolved relative to the job file
+JOB_PATH_KEYS = CLI_INPUT_FILES + ("output", "zip", "metrics")
+
+
+def cli_parser():
+    """
+    Returns:
+        argparse.ArgumentParser: The parser for the command line options, see cli.
+    """
+    parser = argparse.ArgumentParser(
+        prog="sef_reports.py", description="Builds the 401(K) preliminary reports without the Streamlit app.")
+    parser.add_argument("--job", help="A JSON job file with one or more runs, see load_job_file. "
+                        "Its values take precedence over the options below.")
+    parser.add_argument("-v", "--verbose", action="count", default=0,
+                        help="Log more detail; -vv also logs debug output.")
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="Only print errors.")
+    run = parser.add_argument_group("run")
+    run.add_argument("--year", type=int, help="The year of the reports.")
+    run.add_argument("--quarter", type=int, choices=range(1, 5),
+                     help="The quarter of the reports.")
+    run.add_argument("--output", help="The folder the reports are saved in.")
+    run.add_argument("--os", choices=["Windows", "Mac"], default="Windows" if os.name == "nt" else "Mac",
+                     help="The path style of the report file names.")
+    run.add_argument("--clients", help="The clients list Excel file.")
+    run.add_argument("--in-brief", help="The In Brief Word document.")
+    run.add_argument("--requirements", help="The requirements Excel file.")
+    run.add_argument("--general-items", help="The general items Excel file.")
+    run.add_argument("--at-a-glance", help="The At A Glance Excel file.")
+    run.add_argument("--fine-print",
+                     help="The At A Glance fine print Word document.")
+    run.add_argument("--header-image", help="The header image (PNG or JPG).")
+    run.add_argument("--footer-image", help="The footer image (PNG or JPG).")
+    run.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                     help="The number of worker processes. Defaults to the number of CPUs.")
+    run.add_argument("--zip", help="Also write every report into this zip file.")
+    run.add_argument("--compression-level", type=int, choices=range(10), default=ARCHIVE_COMPRESSION_LEVEL,
+                     help="The zip compression level; 0 stores the reports uncompressed.")
+    run.add_argument("--no-save", dest="save", action="store_false",
+                     help="Only write the zip file, not the reports folder. Needs --zip.")
+    run.add_argument("--incremental", action="store_true",
+                     help="Only rebuild the reports whose inputs changed since the last run.")
+    run.add_argument("--no-resume", dest="resume", action="store_false",
+                     help="Rebuild every report even if the last run was interrupted.")
+    run.add_argument("--store", action="store_true",
+                     help="Keep the requirements and general items in a local database next to the folder.")
+    run.add_argument("--metrics", help="Write the run's timings to this JSON file.")
+    run.add_argument("--profile", action="store_true",
+                     help="Profile each stage with cProfile (slow).")
+    run.add_argument("--trace-memory", action="store_true",
+                     help="Record the peak memory of each stage (slow).")
+    return parser
+
+
+def load_job_file(path, defaults):
+    """
+    Reads a JSON job file, for scheduled runs that build several sets of reports.
+
+    The file holds either a list of runs or {"defaults": {...}, "runs": [...]}. Each run
+    uses the command line option names as keys, with underscores (e.g. "general_items",
+    "compression_level"), plus an optional "name". Relative paths are relative to the
+    job file.
+
+    Args:
+        path (str): The path of the job file.
+        defaults (dict): The settings from the command line, used for any key a run leaves out.
+
+    Returns:
+        list: The settings of each run.
+
+    Raises:
+        ValueError: If the file is not a valid job file.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        job = json.load(f)
+    if isinstance(job, list):
+        job = {"runs": job}
+    if not isinstance(job, dict) or not isinstance(job.get("runs"), list):
+        raise ValueError(f"{path} must hold a list of runs")
+    if not isinstance(job.get("defaults", {}), dict):
+        raise ValueError(f"The defaults in {path} must be an object")
+    directory = os.path.dirname(os.path.abspath(path))
+    runs = []
+    for number, run in enumerate(job["runs"], 1):
+        if not isinstance(run, dict):
+            raise ValueError(f"Run {number} in {path} must be an object")
+        settings = {**job.get("defaults", {}), **run}
+        unknown = set(settings) - set(defaults) - {"name"}
+        if unknown:
+            raise ValueError(
+                f"Unknown keys in {path}: {', '.join(sorted(unknown))}")
+        for key in JOB_PATH_KEYS:
+            if isinstance(settings.get(key), str) and settings[key]:
+                settings[key] = os.path.join(
+                    directory, os.path.expanduser(settings[key]))
+        runs.append({**defaults, **settings})
+    return runs
+
+
+def check_run_settings(settings):
+    """
+    Args:
+        settings (dict): The command line options of a run, see cli_parser.
+
+    Raises:
+        ValueError: If the settings are incomplete.
+    """
+    missing = [key for key in ("year", "quarter", "output") +
+               CLI_INPUT_FILES if settings.get(key) in (None, "")]
+    if missing:
+        raise ValueError("Missing " + ", ".join("--" +
+                         key.replace("_", "-") for key in missing))
+    if not settings["save"] and not settings["zip"]:
+        raise ValueError("--no-save needs --zip")
+
+
+def run_batch(settings, quiet=False):
+    """
+    Runs main() for one set of reports from the command line, printing each report as it
+    is done and a timing breakdown at the end.
+
+    Args:
+        settings (dict): The command line options of the run, see cli_parser.
+        quiet (bool, optional): Only print errors. Defaults to False.
+
+    Returns:
+        bool: True if every report was built.
+
+    Raises:
+        ValueError: If the settings are incomplete.
+    """
+    check_run_settings(settings)
+    write_to_disk = settings["save"]
+    outer_folder_name = settings["output"]
+    manifest = ReportManifest.load(report_manifest_path(
+        outer_folder_name)) if settings["incremental"] and write_to_disk else None
+    journal = RunJournal(report_journal_path(
+        outer_folder_name)) if settings["resume"] and write_to_disk else None
+    store = ClientRowStore(client_row_store_path(
+        outer_folder_name)) if settings["store"] else None
+    metrics = RunMetrics(
+        profile=settings["profile"], trace_memory=settings["trace_memory"])
+    start = time.perf_counter()
+
+    def progress(done, total, file_path):
+        if not quiet:
+            print(f"[{done}/{total}] {ntpath.basename(file_path)} ({time.perf_counter() - start:.1f}s)",
+                  flush=True)
+
+    zip_file = None
+    archive = None
+    if settings["zip"]:
+        directory = os.path.dirname(settings["zip"])
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        zip_file = open(settings["zip"], "wb")
+        archive = ReportArchive(
+            zip_file, compresslevel=settings["compression_level"])
+    errors = []
+    try:
+        file_paths = main(settings["year"], settings["quarter"], outer_folder_name, settings["os"],
+                          settings["clients"], settings["in_brief"], settings["requirements"],
+                          settings["general_items"], settings["at_a_glance"], settings["fine_print"],
+                          settings["header_image"], settings["footer_image"],
+                          workers=settings["workers"], archive=archive, write_to_disk=write_to_disk,
+                          manifest=manifest, journal=journal, metrics=metrics, store=store, progress=progress)
+    except ReportGenerationError as error:
+        file_paths = error.file_paths
+        errors = error.errors
+    finally:
+        if archive is not None:
+            archive.close()
+            zip_file.close()
+        if store is not None:
+            store.close()
+        if settings["metrics"]:
+            metrics.save(settings["metrics"])
+
+    if not quiet:
+        print(metrics.stage_table().to_string(index=False))
+        summary = f"{len(file_paths)} report(s) done in {time.perf_counter() - start:.1f}s"
+        if manifest is not None:
+            summary += f", {len(manifest.reused)} unchanged report(s) reused"
+        if journal is not None and journal.resumed:
+            summary += f", {len(journal.resumed)} kept from an interrupted run"
+        print(summary + ".")
+    for error in errors:
+        print(f"FAILED: {error['client']} ({error['stage'] or 'unknown stage'})\n{error['traceback']}",
+              file=sys.stderr)
+    if errors:
+        print(f"{len(errors)} report(s) could not be built.", file=sys.stderr)
+    return not errors
+
+
+def cli(argv=None):
+    """
+    The command line entry point, e.g.
+
+        python sef_reports.py --year 2021 --quarter 1 --output reports --clients clients.xlsx ... --zip reports.zip
+        python sef_reports.py --job nightly.json
+
+    Args:
+        argv (list, optional): The arguments. Defaults to sys.argv[1:].
+
+    Returns:
+        int: The exit status: 0 if every report of every run was built, 1 otherwise.
+    """
+    parser = cli_parser()
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING - 10 * min(args.verbose, 2),
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    settings = vars(args)
+    job = settings.pop("job")
+    quiet = settings.pop("quiet")
+    settings.pop("verbose")
+    try:
+        runs = load_job_file(job, settings) if job else [settings]
+        for run in runs:
+            check_run_settings(run)
+    except (OSError, ValueError) as error:
+        parser.error(str(error))
+
+    failed = 0
+    for number, run in enumerate(runs, 1):
+        name = run.pop("name", None) or run.get("output")
+        if len(runs) > 1 and not quiet:
+            print(f"== Run {number}/{len(runs)}: {name}", flush=True)
+        try:
+            if not run_batch(run, quiet=quiet):
+                failed += 1
+        except Exception as error:
+            logger.debug("Run %s failed", name, exc_info=True)
+            print(f"Run {name} failed: {error}", file=sys.stderr)
+            failed += 1
+    if failed and len(runs) > 1:
+        print(f"{failed} of {len(runs)} run(s) failed.", file=sys.stderr)
+    return 1 if failed else 0
+
+
+# ************ END COMMAND LINE ************ #
+
+
+# ************ START BACKGROUND JOBS ************ #
+
+
+class ReportJob:
+    """
+    Runs main() on a background thread, so that a caller such as the Streamlit app can
+    show its progress while it runs, cancel it, and pick up the result later.
+
+    The thread only reads the job's own inputs, so uploads should be copied (e.g. into
+    io.BytesIO) before the job starts. A cancelled job stops before its next report; the
+    reports it already built are kept, and with a journal the next run resumes from there.
+
+    Args:
+        *args: The positional arguments of main().
+        archive (ReportArchive, optional): See main(). It is closed when the job ends and
+            its contents kept in archive_data. Defaults to None.
+        store (ClientRowStore, optional): See main(). It is closed when the job ends. Defaults to None.
+        metrics (RunMetrics, optional): See main(). Defaults to a new RunMetrics.
+        **kwargs: The other keyword arguments of main(), except progress and cancel.
+
+    Attributes:
+        state (str): "pending", "running", then "done", "failed" (some reports could not be
+            built), "cancelled" or "error" (the run itself failed).
+        done (int): How many reports are finished, reused or failed so far.
+        total (int): How many reports the run builds, once it is known.
+        current (str): The last report that was finished.
+        file_paths (list): The reports that were built, once the job has ended.
+        errors (list): The reports that failed, as in ReportGenerationError.
+        error (Exception): What stopped the run, if state is "error".
+        archive_data (bytes): The zip archive, once the job has ended.
+    """
+
+    def __init__(self, *args, archive=None, store=None, metrics=None, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        self.archive = archive
+        self.store = store
+        self.metrics = metrics if metrics is not None else RunMetrics()
+        self.manifest = kwargs.get("manifest")
+        self.journal = kwargs.get("journal")
+        self.state = "pending"
+        self.done = 0
+        self.total = 0
+        self.current = None
+        self.file_paths = []
+        self.errors = []
+        self.error = None
+        self.archive_data = None
+        self.started = None
+        self.finished = None
+        # When the first report was done, and how many were done by then, for the ETA
+        self._first_progress = None
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(
+            target=self.run, name="report-job", daemon=True)
+
+    @property
+    def running(self):
+        """
+        bool: Whether the job has started and not yet ended.
+        """
+        return self.started is not None and self.finished is None
+
+    @property
+    def cancelling(self):
+        """
+        bool: Whether the job was asked to stop.
+        """
+        return self._cancel.is_set()
+
+    def start(self):
+        """
+        Starts the job on its thread.
+
+        Returns:
+            ReportJob: The job.
+        """
+        self.started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        """
+        Asks the job to stop before its next report. Returns at once, see join().
+        """
+        self._cancel.set()
+
+    def join(self, timeout=None):
+        """
+        Waits for the job to end.
+
+        Args:
+            timeout (float, optional): The most seconds to wait. Defaults to waiting until it ends.
+
+        Returns:
+            bool: Whether the job has ended.
+        """
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def progress(self, done, total, file_path):
+        """
+        Records the progress of the run, see generate_reports.
+        """
+        if self._first_progress is None:
+            self._first_progress = (time.perf_counter(), done)
+        self.done = done
+        self.total = total
+        self.current = file_path
+
+    def run(self):
+        """
+        Runs the job on the current thread. start() runs it on the job's own thread.
+        """
+        self.state = "running"
+        try:
+            self.file_paths = main(*self.args, archive=self.archive, store=self.store, metrics=self.metrics,
+                                   progress=self.progress, cancel=self._cancel, **self.kwargs)
+            self.state = "done"
+        except ReportGenerationError as error:
+            self.file_paths = error.file_paths
+            self.errors = error.errors
+            self.state = "failed"
+        except ReportGenerationCancelled as error:
+            self.file_paths = error.file_paths
+            self.errors = error.errors
+            self.state = "cancelled"
+        except Exception as error:
+            logger.debug("Report job failed", exc_info=True)
+            self.error = error
+            self.state = "error"
+        finally:
+            try:
+                if self.archive is not None:
+                    self.archive_data = self.archive.close().read()
+            finally:
+                if self.store is not None:
+                    self.store.close()
+                self.finished = time.perf_counter()
+
+    def elapsed(self):
+        """
+        Returns:
+            float: The seconds the job has been running, or ran for.
+        """
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.perf_counter()) - self.started
+
+    def eta_seconds(self):
+        """
+        Returns:
+            float: The estimated seconds until the last report is done, from the average time
+            per report since the first one was done, or None until that can be worked out.
+        """
+        if self._first_progress is None or self.finished is not None:
+            return None
+        first_time, first_done = self._first_progress
+        if self.done <= first_done:
+            return None
+        return (time.perf_counter() - first_time) / (self.done - first_done) * (self.total - self.done)
+
+    def current_stage(self):
+        """
+        Returns:
+            str: The stage the run is in right now, see RunMetrics.current_stage.
+        """
+        return self.metrics.current_stage()
+
+
+# ************ END BACKGROUND JOBS ************ #
+
+
+if __name__ == "__main__":
+    sys.exit(cli())